@@ -19,16 +19,21 @@ from .item import Item, flatten_items
 from .item.inventory import Inventory
 from .level import Level
 from .monster_tracker import MonsterTracker, disappearance_mask
+from .observation_features import ObservationFeatures
+from .observation_store import ObservationStore
 from .stats_logger import StatsLogger
-from .strategy import Strategy
+from .strategy import Strategy, StrategyProfiler
+from .tty_screen import TtyScreen
 
 BLStats = namedtuple('BLStats',
                      'x y strength_percentage strength dexterity constitution intelligence wisdom charisma score hitpoints max_hitpoints depth gold energy max_energy armor_class monster_level experience_level experience_points time hunger_state carrying_capacity dungeon_number level_number prop_mask')
 
 
 class Agent:
+    BFS_REPAIR_MAX_CHANGED = 32  # see `utils.bfs_repair`
+
     def __init__(self, env, seed=0, verbose=False, panic_on_errors=False,
-                 rl_model_to_train=None, rl_model_training_comm=(None, None)):
+                 rl_model_to_train=None, rl_model_training_comm=(None, None), profile_strategies=False):
         self.env = env
         self.verbose = verbose
         self.rng = np.random.RandomState(seed)
@@ -42,6 +47,8 @@ class Agent:
         self.score = 0
         self.step_count = 0
         self._observation = None  # this should be used in additional_action_iterator generators
+        self.screen = None  # TtyScreen of `_observation`
+        self._observation_store = ObservationStore()
         # single_{message,popup} should be used in additional_action_itertator generators.
         # (non-single) message & popup contain cummulated content
         self.message = self.single_message = ''
@@ -60,8 +67,18 @@ class Agent:
 
         self.last_bfs_dis = None
         self.last_bfs_step = None
+        self._last_bfs_key = None  # (level key, y, x, can_squeeze) of `last_bfs_dis`
+        self._last_bfs_masks = None  # (walkable, walkable_diagonally) used to compute `last_bfs_dis`
+        self._walkability_masks_key = {}  # avoid_traps -> cache key
+        self._walkability_masks = {}  # avoid_traps -> (walkable, walkable_diagonally)
         self.last_prayer_turn = None
         self._previous_glyphs = None
+        self.glyph_classes = None  # see utils.glyph_classes
+        self._previous_glyph_classes = None
+        self._features = None
+        self._features_step = None
+        self.false_conditions = {}  # see Strategy.depends_on
+        self._content_versions = {}  # name -> (last seen array, version)
         self._last_turn = -1
         self._inactivity_counter = 0
         self._is_updating_state = False
@@ -86,6 +103,10 @@ class Agent:
 
         self.stats_logger = StatsLogger()
 
+        # Strategy.profiler is global, so it's reset for every agent
+        Strategy.profiler = StrategyProfiler() if profile_strategies else None
+        self.stats_logger.strategy_profiler = Strategy.profiler
+
     @property
     def has_pet(self):
         return (self.blstats.time - self._last_pet_seen) <= 16
@@ -208,8 +229,8 @@ class Agent:
         for strategy in strategies:
             def f(iden, strategy):
                 it = strategy.strategy()
-                if next(it):
-                    raise AgentChangeStrategy(iden, it)
+                if strategy.next_condition(it):
+                    raise AgentChangeStrategy(iden, (strategy, it))
 
             iden = (id(f), id(strategy))
             fun = partial(f, iden, strategy)
@@ -253,11 +274,8 @@ class Agent:
                 iterator = e.args[1]
 
             if iterator is not None:
-                try:
-                    next(iterator)
-                    assert 0, iterator
-                except StopIteration:
-                    pass
+                strategy, iterator = iterator
+                strategy.finish(iterator)
 
                 if not continue_after_preemption:
                     break
@@ -275,29 +293,28 @@ class Agent:
         self.update_state()
 
     @staticmethod
-    def _find_marker(lines, regex=re.compile(r"(--More--|\(end\)|\(\d+ of \d+\))")):
+    def _find_marker(screen):
         """ Return (line, column) of markers:
         --More-- | (end) | (X of N)
         """
-        if len(regex.findall(' '.join(lines))) > 1:
+        markers = screen.find_markers()
+        if len(markers) > 1:
             raise ValueError('Too many markers')
 
         result, marker_type = None, None
-        for i, line in enumerate(lines):
-            res = regex.findall(line)
-            if res:
-                assert len(res) == 1
-                j = line.find(res[0])
-                result, marker_type = (i, j), res[0]
-                break
+        if markers:
+            i, j, marker_type = markers[0]
+            result = (i, j)
 
         if result is not None and result[1] == 1:
             result = (result[0], 0)  # e.g. for known items view
         return result, marker_type
 
-    def get_message_and_popup(self, obs):
+    def get_message_and_popup(self, obs, screen=None):
         """ Uses MORE action to get full popup and/or message.
         """
+        if screen is None:
+            screen = TtyScreen(obs['tty_chars'])
 
         message = bytes(obs['message']).decode().replace('\0', ' ').replace('\n', '').strip()
         if message.endswith('--More--'):
@@ -309,8 +326,7 @@ class Agent:
         # assert '\n' not in message and '\r' not in message
         popup = []
 
-        lines = [bytes(line).decode().replace('\0', ' ').replace('\n', '') for line in obs['tty_chars']]
-        marker_pos, marker_type = self._find_marker(lines)
+        marker_pos, marker_type = self._find_marker(screen)
 
         if marker_pos is None:
             return message, popup, True
@@ -318,7 +334,8 @@ class Agent:
         pref = ''
         message_lines_count = 0
         if message:
-            for i, line in enumerate(lines[:marker_pos[0] + 1]):
+            for i in range(marker_pos[0] + 1):
+                line = screen.line(i)
                 if i == marker_pos[0]:
                     line = line[:marker_pos[1]]
                 message_lines_count += 1
@@ -339,7 +356,8 @@ class Agent:
                 raise ValueError(f"Message:\n{repr(message)}\ndoesn't match the screen:\n{repr(pref)}")
 
         # cut out popup
-        for l in lines[message_lines_count:marker_pos[0]] + [lines[marker_pos[0]][:marker_pos[1]]]:
+        for l in [screen.line(i) for i in range(message_lines_count, marker_pos[0])] + \
+                 [screen.line(marker_pos[0])[:marker_pos[1]]]:
             l = l[marker_pos[1]:].strip()
             if l:
                 popup.append(l)
@@ -354,7 +372,7 @@ class Agent:
             message_prefix = ''
             popup_prefix = []
 
-        self.single_message, self.single_popup, done = self.get_message_and_popup(obs)
+        self.single_message, self.single_popup, done = self.get_message_and_popup(obs, self.screen)
         self.single_message = self.single_message.strip()
         self.single_popup = [p.strip() for p in self.single_popup]
 
@@ -370,7 +388,7 @@ class Agent:
             assert len(action) == 1
             action = A.ACTIONS[A.ACTIONS.index(ord(action))]
         observation, reward, done, info = self.env.step(action)
-        observation = {k: v.copy() for k, v in observation.items()}
+        observation = self._observation_store.copy(observation)
         self.step_count += 1
         self.score += reward
 
@@ -390,6 +408,7 @@ class Agent:
 
     def update(self, observation, additional_action_iterator=None):
         self._observation = observation
+        self.screen = TtyScreen(observation['tty_chars'])
         done = self.update_message_and_popup(observation)
 
         self._is_reading_message_or_popup = True
@@ -425,7 +444,7 @@ class Agent:
             self.step(A.Command.ESC)
             return
 
-        if b'[yn]' in bytes(observation['tty_chars'].reshape(-1)):
+        if b'[yn]' in self.screen:
             self.type_text('y')
             return
 
@@ -450,6 +469,10 @@ class Agent:
 
         self.blstats = BLStats(*self.last_observation['blstats'])
         self.glyphs = self.last_observation['glyphs']
+        self._previous_glyph_classes = self.glyph_classes
+        self.glyph_classes = utils.glyph_classes(self.glyphs)
+        if self._previous_glyphs is self.glyphs:
+            self._previous_glyph_classes = self.glyph_classes
 
         self.stats_logger.log_cumulative_value('max_turns_on_position',
                                                key=(self.current_level().dungeon_number,
@@ -504,8 +527,7 @@ class Agent:
         level.items[self.blstats.y, self.blstats.x] = self.inventory.items_below_me
         level.item_count[self.blstats.y, self.blstats.x] = len(self.inventory.items_below_me)
 
-        # TODO: optimize
-        ignore_mask = utils.isin(self.glyphs, G.MONS, G.PETS)  # TODO: effects, etc
+        ignore_mask = self.features.mask(G.MONS, G.PETS)  # TODO: effects, etc
         item_mask = level.item_count != 0
         mask = item_mask & ~ignore_mask
         level.item_disagreement_counter[~mask] = 0
@@ -533,15 +555,10 @@ class Agent:
             shop_type = SHOP.name2id[shop_name]
 
         shopkeepers = list(
-            zip(*(utils.isin(self.glyphs, G.SHOPKEEPER) & self.monster_tracker.peaceful_monster_mask).nonzero()))
+            zip(*(self.features.shopkeepers & self.monster_tracker.peaceful_monster_mask).nonzero()))
         for y, x in shopkeepers:
-            wall_mask = utils.isin(level.objects, G.WALL)
-            entry = ((utils.translate(wall_mask, 1, 0) & utils.translate(wall_mask, -1, 0)) |
-                     (utils.translate(wall_mask, 0, 1) & utils.translate(wall_mask, 0, -1))) & \
-                    level.walkable
-            walkable = level.walkable & ~entry
-            mask = utils.bfs(y, x, walkable=walkable, walkable_diagonally=walkable, can_squeeze=False) != -1
-            mask = utils.dilate(mask, radius=1)
+            entry = level.shop_entries()
+            mask = utils.dilate(level.shop_region(y, x), radius=1)
 
             level.shop[mask] = True
             if mask[self.blstats.y, self.blstats.x] and shop_type is not None:
@@ -564,9 +581,9 @@ class Agent:
 
         if not self.character.prop.hallu and mnames:
             old_mons = self._previous_glyphs.copy()
-            old_mons[~utils.isin(self._previous_glyphs, G.MONS, G.INVISIBLE_MON)] = -1
+            old_mons[~utils.class_mask(self._previous_glyph_classes, G.MONS, G.INVISIBLE_MON)] = -1
             new_mons = self.glyphs.copy()
-            new_mons[~utils.isin(self.glyphs, G.MONS, G.INVISIBLE_MON)] = -1
+            new_mons[~self.features.mask(G.MONS, G.INVISIBLE_MON)] = -1
             mask = disappearance_mask(old_mons, new_mons, 1)
             mons = old_mons.copy()
             mons[~mask] = -1
@@ -594,28 +611,27 @@ class Agent:
                 old_possible_corpses[item.monster_id]
 
     def update_level(self):
-        if utils.isin(self.glyphs, G.SWALLOW).any():
+        if self.features.any(G.SWALLOW):
             return
 
-        if utils.any_in(self.glyphs, G.PETS):
+        if self.features.any(G.PETS):
             self._last_pet_seen = self.blstats.time
 
         level = self.current_level()
 
-        mask = utils.isin(self.glyphs, G.FLOOR, G.STAIR_UP, G.STAIR_DOWN, G.DOOR_OPENED, G.TRAPS,
-                          G.ALTAR, G.FOUNTAIN)
-        level.walkable[mask] = True
+        mask = self.features.mask(G.FLOOR, G.STAIR_UP, G.STAIR_DOWN, G.DOOR_OPENED, G.TRAPS, G.ALTAR, G.FOUNTAIN)
+        level.set_walkable(mask, True)
         level.seen[mask] = True
-        level.objects[mask] = self.glyphs[mask]
+        level.set_objects(mask, self.glyphs[mask])
 
-        mask = utils.isin(self.glyphs, G.MONS, G.PETS, G.BODIES, G.OBJECTS, G.STATUES)
+        mask = self.features.mask(G.MONS, G.PETS, G.BODIES, G.OBJECTS, G.STATUES)
         level.seen[mask] = True
-        level.walkable[mask & (level.objects == -1)] = True
+        level.set_walkable(mask & (level.objects == -1), True)
 
-        mask = utils.isin(self.glyphs, G.WALL, G.DOOR_CLOSED, G.BARS)
+        mask = self.features.mask(G.WALL, G.DOOR_CLOSED, G.BARS)
         level.seen[mask] = True
-        level.objects[mask] = self.glyphs[mask]
-        level.walkable[mask] = False
+        level.set_objects(mask, self.glyphs[mask])
+        level.set_walkable(mask, False)
 
         self._update_level_items()
         self._update_level_shops()
@@ -630,8 +646,8 @@ class Agent:
         for y, x in self.neighbors(self.blstats.y, self.blstats.x, shuffle=False):
             if self.glyphs[y, x] in G.STONE:
                 level.seen[y, x] = True
-                level.objects[y, x] = self.glyphs[y, x]
-                level.walkable[y, x] = False  # necessary for the exit route from vaults
+                level.set_objects((y, x), self.glyphs[y, x])
+                level.set_walkable((y, x), False)  # necessary for the exit route from vaults
 
         # ad aerarium -- avoid valut entrance
         if self.inventory.engraving_below_me and nltk.edit_distance(self.inventory.engraving_below_me,
@@ -641,10 +657,50 @@ class Agent:
                 y, x = self.blstats.y + dy, self.blstats.x + dx
                 if (0 <= y < level.forbidden.shape[0] and 0 <= x < level.forbidden.shape[1]) \
                         and not level.walkable[y, x]:
-                    level.forbidden[y, x] = True
+                    level.set_forbidden((y, x))
+
+        level.walkability_version += 1
 
     ######## TRIVIAL HELPERS
 
+    def _content_version(self, name, array):
+        last, version = self._content_versions.get(name, (None, 0))
+        if last is not array and (last is None or not np.array_equal(last, array)):
+            version += 1
+            self._content_versions[name] = (array, version)
+        return version
+
+    def dependency_versions(self, dependencies):
+        """ Returns values that change whenever the given parts of the state do, see `Strategy.depends_on`
+        """
+        level = self.current_level()
+        ret = []
+        for dependency in dependencies:
+            if dependency == 'glyphs':
+                ret.append(self._content_version('glyphs', self.glyphs))
+            elif dependency == 'blstats':
+                ret.append(self.blstats)
+            elif dependency == 'turn':
+                ret.append(self.blstats.time)
+            elif dependency == 'position':
+                ret.append((level.key(), self.blstats.y, self.blstats.x))
+            elif dependency == 'inventory':
+                ret.append(self._content_version('inventory', self.last_observation['inv_strs']))
+            elif dependency == 'level':
+                ret.append((level.key(), level.terrain_version))
+            else:
+                assert 0, dependency
+        return tuple(ret)
+
+    @property
+    def features(self):
+        """ Memoized masks of the current observation, see `ObservationFeatures` """
+        if self._features is None or self._features_step != self.step_count or \
+                self._features.glyphs is not self.glyphs:
+            self._features = ObservationFeatures(self.glyphs, self.glyph_classes)
+            self._features_step = self.step_count
+        return self._features
+
     def current_level(self):
         key = (self.blstats.dungeon_number, self.blstats.level_number)
         if key not in self.levels:
@@ -937,68 +993,138 @@ class Agent:
 
         return ret
 
-    def bfs(self, y=None, x=None):
-        if y is None:
-            y = self.blstats.y
-        if x is None:
-            x = self.blstats.x
-
-        if self.last_bfs_step == self.step_count and y == self.blstats.y and x == self.blstats.x:
-            return self.last_bfs_dis.copy()
+    def walkability_masks(self, avoid_traps=None):
+        """ Returns (walkable, walkable_diagonally) masks of the current level used for path finding.
 
+        The masks are computed once per observation and walkability version of the level, and shared by
+        all callers, so they must not be modified in place.
+        """
         level = self.current_level()
+        if avoid_traps is None:
+            avoid_traps = self._last_turn - self._allow_walking_through_traps_turn > 50
+        key = (level.key(), level.walkability_version, self.step_count, avoid_traps)
+        if self._walkability_masks_key.get(avoid_traps) == key:
+            return self._walkability_masks[avoid_traps]
 
-        walkable = level.walkable & ~utils.isin(self.glyphs, G.BOULDER) & \
+        walkable = level.walkable & ~self.features.boulders & \
                    ~self.monster_tracker.peaceful_monster_mask & \
                    ~level.forbidden
 
-        if self._last_turn - self._allow_walking_through_traps_turn > 50:
+        if avoid_traps:
             walkable &= ~utils.isin(level.objects, G.TRAPS)
 
-        for my, mx in list(zip(*np.nonzero(utils.isin(self.glyphs, G.MONS)))):
+        for my, mx in self.features.coords(G.MONS):
             mon = MON.permonst(self.glyphs[my][mx])
             if mon.mname in combat.monster_utils.ONLY_RANGED_SLOW_MONSTERS:
                 walkable[my, mx] = False
 
-        dis = utils.bfs(y, x,
-                        walkable=walkable,
-                        walkable_diagonally=walkable & ~utils.isin(level.objects, G.DOORS) & (level.objects != -1),
-                        can_squeeze=self.inventory.items.total_weight <= 600 and \
-                                    self.current_level().dungeon_number != Level.SOKOBAN,
-                        )
+        walkable_diagonally = walkable & ~utils.isin(level.objects, G.DOORS) & (level.objects != -1)
+
+        walkable.flags.writeable = False
+        walkable_diagonally.flags.writeable = False
+        self._walkability_masks_key[avoid_traps] = key
+        self._walkability_masks[avoid_traps] = (walkable, walkable_diagonally)
+        return self._walkability_masks[avoid_traps]
+
+    def bfs(self, y=None, x=None):
+        if y is None:
+            y = self.blstats.y
+        if x is None:
+            x = self.blstats.x
+
+        level = self.current_level()
+        masks = self.walkability_masks()
+        walkable, walkable_diagonally = masks
+        can_squeeze = self.inventory.items.total_weight <= 600 and \
+                      self.current_level().dungeon_number != Level.SOKOBAN
 
         if y == self.blstats.y and x == self.blstats.x:
+            bfs_key = (level.key(), y, x, can_squeeze)
+            if self.last_bfs_dis is not None and self._last_bfs_key == bfs_key:
+                if self._last_bfs_masks is masks:
+                    return self.last_bfs_dis.copy()
+
+                # most steps change only a handful of tiles, so repair the previous distance map
+                old_walkable, old_walkable_diagonally = self._last_bfs_masks
+                dis = utils.bfs_repair(self.last_bfs_dis,
+                                       old_walkable=old_walkable,
+                                       old_walkable_diagonally=old_walkable_diagonally,
+                                       walkable=walkable,
+                                       walkable_diagonally=walkable_diagonally,
+                                       can_squeeze=can_squeeze,
+                                       max_changed=self.BFS_REPAIR_MAX_CHANGED)
+            else:
+                dis = utils.bfs(y, x, walkable=walkable, walkable_diagonally=walkable_diagonally,
+                                can_squeeze=can_squeeze)
+
             self.last_bfs_dis = dis
             self.last_bfs_step = self.step_count
+            self._last_bfs_key = bfs_key
+            self._last_bfs_masks = masks
+        else:
+            dis = utils.bfs(y, x, walkable=walkable, walkable_diagonally=walkable_diagonally,
+                            can_squeeze=can_squeeze)
 
         return dis.copy()
 
-    def path(self, from_y, from_x, to_y, to_x, dis=None):
+    def bfs_nearest(self, targets):
+        """ Returns (dis, parent) of BFS from the agent position, stopped at the layer of the nearest target.
+        See `utils.bfs_nearest` for details.
+        """
+        walkable, walkable_diagonally = self.walkability_masks()
+        return utils.bfs_nearest(self.blstats.y, self.blstats.x, targets,
+                                 walkable=walkable,
+                                 walkable_diagonally=walkable_diagonally,
+                                 can_squeeze=self.inventory.items.total_weight <= 600 and \
+                                             self.current_level().dungeon_number != Level.SOKOBAN)
+
+    def dijkstra(self, cost):
+        """ Returns (dis, parent) of weighted path search from the agent position, where entering a tile
+        costs 1 + cost[tile]. Traps are walkable here -- penalize them in `cost` instead (see `movement_cost`).
+        """
+        walkable, walkable_diagonally = self.walkability_masks(avoid_traps=False)
+        return utils.dijkstra(self.blstats.y, self.blstats.x, cost,
+                              walkable=walkable,
+                              walkable_diagonally=walkable_diagonally,
+                              can_squeeze=self.inventory.items.total_weight <= 600 and \
+                                          self.current_level().dungeon_number != Level.SOKOBAN)
+
+    def movement_cost(self, trap_cost=20, shop_cost=2, line_of_fire_cost=3):
+        """ Default per-tile additional cost for `go_to(..., cost=...)` """
+        level = self.current_level()
+        cost = np.zeros((C.SIZE_Y, C.SIZE_X), dtype=np.float64)
+        cost[utils.isin(level.objects, G.TRAPS)] += trap_cost
+        cost[level.shop_interior] += shop_cost
+        walkable, _ = self.walkability_masks(avoid_traps=False)
+        combat.movement_priority.draw_line_of_fire_cost(self, self.get_visible_monsters(), cost, walkable,
+                                                         line_of_fire_cost)
+        return cost
+
+    def path(self, from_y, from_x, to_y, to_x, dis=None, parent=None, deterministic=False):
+        """ Returns a shortest path [(from_y, from_x), ..., (to_y, to_x)].
+
+        If `parent` (predecessor map from `utils.bfs_with_parents` or `utils.bfs_nearest`) is given,
+        the path is read from it. Otherwise the path is reconstructed from the distance map `dis`
+        with ties broken randomly, or in fixed order if `deterministic` is set.
+        """
         if from_y == to_y and from_x == to_x:
             return [(to_y, to_x)]
 
-        if dis is None:
-            dis = self.bfs(from_y, from_x)
+        if parent is not None:
+            path = utils.path_from_parents(parent, to_y, to_x)
+        else:
+            if dis is None:
+                dis = self.bfs(from_y, from_x)
 
-        assert dis[to_y, to_x] != -1
+            assert dis[to_y, to_x] != -1
 
-        # FIXME: currently the path can lead through diagonally inwalkable tiles.
-        #        The path is the shortest possible, so the agent is guaranteed to
-        #        unstuck itself eventually (usually a few panic exceptions) if that happens
+            # FIXME: currently the path can lead through diagonally inwalkable tiles.
+            #        The path is the shortest possible, so the agent is guaranteed to
+            #        unstuck itself eventually (usually a few panic exceptions) if that happens
 
-        cur_y, cur_x = to_y, to_x
-        path_rev = [(cur_y, cur_x)]
-        while cur_y != from_y or cur_x != from_x:
-            for y, x in self.neighbors(cur_y, cur_x):
-                if dis[y, x] == dis[cur_y, cur_x] - 1 and dis[y, x] >= 0:
-                    path_rev.append((y, x))
-                    cur_y, cur_x = y, x
-                    break
-            else:
-                assert 0
+            path = utils.path_from_dis(dis, to_y, to_x, -1 if deterministic else self.rng.randint(2 ** 31))
 
-        assert dis[cur_y, cur_x] == 0 and from_y == cur_y and from_x == cur_x
-        path = path_rev[::-1]
+        path = [(y, x) for y, x in path.tolist()]
         assert path[0] == (from_y, from_x) and path[-1] == (to_y, to_x)
         return path
 
@@ -1020,12 +1146,28 @@ class Agent:
             return True
 
     def go_to(self, y, x, stop_one_before=False, max_steps=None,
-              debug_tiles_args=None, callback=lambda: False, fast=False):
+              debug_tiles_args=None, callback=lambda: False, fast=False, cost=None):
+        """ Go to (y, x) by a shortest path.
+
+        If `cost` (per-tile additional cost of walking, e.g. from `movement_cost`) is given, the path
+        minimizing the total cost is used instead, which allows walking through traps if necessary.
+        `cost` can also be a function returning the cost array, which is then called on every replanning
+        (e.g. `cost=self.movement_cost` follows the monsters' lines of fire).
+        """
         assert not stop_one_before or (self.blstats.y != y or self.blstats.x != x)
         assert max_steps is None or not fast
+        assert cost is None or not fast, 'travel command ignores the cost'
 
-        if stop_one_before and self.bfs()[y, x] == -1:
-            dis = self.bfs()
+        def plan():
+            if cost is None:
+                return self.bfs(), None
+            return self.dijkstra(cost() if callable(cost) else cost)
+
+        # replanned only after the agent takes a step
+        dis, parent = plan()
+        planned_step = self.step_count
+
+        if stop_one_before and dis[y, x] == -1:
             best_p = None
             for ny, nx in self.neighbors(y, x):
                 if dis[ny, nx] != -1 and (best_p is None or dis[best_p] > dis[ny, nx]):
@@ -1035,17 +1177,19 @@ class Agent:
             y, x = best_p
             stop_one_before = False
 
-        assert self.bfs()[y, x] != -1
+        assert dis[y, x] != -1
 
         if callback():
             return
         steps_taken = 0
         cont = True
         while cont and (self.blstats.y, self.blstats.x) != (y, x):
-            dis = self.bfs()
+            if self.step_count != planned_step:
+                dis, parent = plan()
+                planned_step = self.step_count
             if dis[y, x] == -1:
                 raise AgentPanic('end point is no longer accessible')
-            path = self.path(self.blstats.y, self.blstats.x, y, x)
+            path = self.path(self.blstats.y, self.blstats.x, y, x, parent=parent)
             orig_path = path
             path = path[1:]
             if stop_one_before:
@@ -1240,14 +1384,14 @@ class Agent:
     @utils.debug_log('engulfed_fight')
     @Strategy.wrap
     def engulfed_fight(self):
-        if not utils.any_in(self.glyphs, G.SWALLOW):
+        if not self.features.any(G.SWALLOW):
             yield False
         yield True
         while True:
-            mask = utils.isin(self.glyphs, G.SWALLOW)
-            if not mask.any():
+            swallow = self.features.coords(G.SWALLOW)
+            if not swallow:
                 break
-            assert self.melee_attack(*list(zip(*mask.nonzero()))[0])
+            assert self.melee_attack(*swallow[0])
 
     def _is_corpse_editable(self, monster_id, age_turn):
         permonst = MON.permonst(monster_id)
@@ -1318,6 +1462,7 @@ class Agent:
 
     @utils.debug_log('eat_corpses_from_ground')
     @Strategy.wrap
+    @Strategy.depends_on('turn', 'position', 'glyphs', 'level')
     def eat_corpses_from_ground(self, only_below_me=True):
         yielded = False
         level = self.current_level()
@@ -1345,7 +1490,10 @@ class Agent:
         if not to_eat:
             yield False
 
-        dis = self.bfs()
+        targets = np.zeros((C.SIZE_Y, C.SIZE_X), dtype=bool)
+        for y, x, _ in to_eat:
+            targets[y, x] = True
+        dis, _ = self.bfs_nearest(targets)
         to_eat = sorted(filter(lambda e: dis[e[0], e[1]] != -1, to_eat), key=lambda e: dis[e[0], e[1]])
         if not to_eat:
             yield False
@@ -1356,7 +1504,8 @@ class Agent:
             if not yielded:
                 yielded = True
                 yield True
-            self.go_to(target_y, target_x, debug_tiles_args=dict(color=(255, 255, 0), is_path=True))
+            self.go_to(target_y, target_x, debug_tiles_args=dict(color=(255, 255, 0), is_path=True),
+                       cost=self.movement_cost)
 
         # TODO: checking level.corpses_to_eat again (moving to non-existing corpses often)
         if (target_y, target_x) in level.corpses_to_eat and monster_id in level.corpses_to_eat[target_y, target_x]:
@@ -1517,13 +1666,16 @@ class Agent:
     def main(self):
         try:
             init_finished = False
+            # the agent can also start in the middle of a game (after a replay or reload)
+            new_game = self.env.step_count == 0
             try:
                 with self.atom_operation():
                     self.step(A.Command.ESC)
                     self.step(A.Command.ESC)
 
-                    self.current_level().stair_destination[self.blstats.y, self.blstats.x] = \
-                        ((Level.PLANE, 1), (None, None))  # TODO: check level num
+                    if new_game:
+                        self.current_level().stair_destination[self.blstats.y, self.blstats.x] = \
+                            ((Level.PLANE, 1), (None, None))  # TODO: check level num
                     self.character.parse()
                     self.character.parse_enhance_view()
                     # self.character.parse_spellcast_view()
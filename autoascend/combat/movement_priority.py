@@ -38,6 +38,15 @@ def _draw_ranged(priority, y, x, value, walkable, radius=1, operation='add'):
                             assert 0, operation
 
 
+def draw_line_of_fire_cost(agent, monsters, cost, walkable, value):
+    """ Add `value` to tiles in line of fire of monsters that are dangerous to approach """
+    for monster in monsters:
+        _, y, x, mon, _ = monster
+        if mon.mname in WEAK_MONSTERS or mon.mname in ONLY_RANGED_SLOW_MONSTERS:
+            continue
+        _draw_ranged(cost, y, x, value, walkable, radius=7)
+
+
 def draw_monster_priority_positive(agent, monster, priority, walkable):
     _, y, x, mon, _ = monster
 
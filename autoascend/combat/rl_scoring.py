@@ -1,5 +1,10 @@
+import json
+
 import numpy as np
+
 from . import utils
+from ..glyph import C, G
+from ..utils import isin
 
 RL_CONTEXT_SIZE = 7
 
@@ -45,10 +50,12 @@ def fight2_semantic_maps(agent):
     radius_y = radius_x = RL_CONTEXT_SIZE // 2
     y1, y2, x1, x2 = agent.blstats.y - radius_y, agent.blstats.y + radius_y + 1, \
                      agent.blstats.x - radius_x, agent.blstats.x + radius_x + 1
+    # the features the model was trained on -- not `agent.walkability_masks()`, which also masks forbidden tiles
+    # and ranged-only monsters, and allows traps for a while after walking through one
     level = agent.current_level()
-    walkable = level.walkable & ~utils.isin(agent.glyphs, G.BOULDER) & \
+    walkable = level.walkable & ~agent.features.boulders & \
                ~agent.monster_tracker.peaceful_monster_mask & \
-               ~utils.isin(level.objects, G.TRAPS)
+               ~isin(level.objects, G.TRAPS)
 
     mspeed = np.ones((C.SIZE_Y, C.SIZE_X), dtype=int) * np.nan
     for _, y, x, mon, _ in agent.get_visible_monsters():
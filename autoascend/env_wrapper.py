@@ -13,6 +13,8 @@ from pprint import pprint
 
 import nle.nethack as nh
 
+from autoascend.snapshot import Snapshot
+from autoascend.trace import TraceRecorder
 from autoascend.visualization import visualizer
 from autoascend import agent as agent_lib  # the library can be reloaded in `reload_agent` function
 
@@ -62,7 +64,7 @@ class ReloadAgent(KeyboardInterrupt):
 
 class EnvWrapper:
     def __init__(self, env, to_skip=0, visualizer_args=dict(enable=False),
-                 step_limit=None, agent_args={}, interactive=False):
+                 step_limit=None, agent_args={}, interactive=False, trace_dir=None):
         self.env = env
         self.agent_args = agent_args
         self.interactive = interactive
@@ -74,6 +76,8 @@ class EnvWrapper:
             self.visualizer = visualizer.Visualizer(self, **visualizer_args)
         self.last_observation = None
         self.agent = None
+        self.recorder = TraceRecorder(trace_dir) if trace_dir is not None else None
+        self._strategy_stack = []  # texts of active `utils.debug_log` strategy scopes, for the trace
 
         self.draw_walkable = False
         self.draw_seen = False
@@ -84,8 +88,16 @@ class EnvWrapper:
     def _init_agent(self):
         self.agent = agent_lib.Agent(self, **self.agent_args)
 
-    def main(self):
+    def main(self, replay_actions=(), play=True):
         self.reset()
+        if len(replay_actions):
+            self.replay(replay_actions)
+        if self.is_done or not play:
+            return
+        self.play()
+
+    def play(self):
+        """ Runs the agent from the current state of the env """
         while 1:
             try:
                 self._init_agent()
@@ -107,6 +119,10 @@ class EnvWrapper:
         self.last_observation = obs
         self.is_done = False
 
+        if self.recorder is not None:
+            self.recorder.meta['seeds'] = list(self.env.get_seeds())
+            self.recorder.record(None, obs)
+
         if self.agent is not None:
             self.render()
 
@@ -117,6 +133,24 @@ class EnvWrapper:
 
         return obs
 
+    def replay(self, actions):
+        """ Feeds recorded actions directly to the env -- without agent logic, rendering and user input """
+        for action in actions:
+            obs, reward, done, info = self.env.step(self.env._actions.index(action))
+            self.score += reward
+            self.step_count += 1
+            self.last_observation = obs
+            if self.recorder is not None:
+                self.recorder.record(action, obs, 'replay')
+            if done:
+                self.is_done = True
+                break
+        return self.last_observation
+
+    def snapshot(self):
+        """ Non-interactive counterpart of `fork` -- see `Snapshot` """
+        return Snapshot(self)
+
     def fork(self):
         fork_again = True
         while fork_again:
@@ -352,6 +386,11 @@ class EnvWrapper:
 
         self.last_observation = obs
 
+        if self.recorder is not None:
+            self.recorder.record(action, obs, ' > '.join(self._strategy_stack) or None)
+            if done:
+                self.recorder.flush()
+
         if done:
             self.is_done = True
             if self.visualizer is not None:
@@ -367,10 +406,16 @@ class EnvWrapper:
             return self.visualizer.debug_tiles(*args, **kwargs)
         return contextlib.suppress()
 
-    def debug_log(self, txt, color=(255, 255, 255)):
-        if self.visualizer is not None:
-            return self.visualizer.debug_log(txt, color)
-        return contextlib.suppress()
+    @contextlib.contextmanager
+    def debug_log(self, txt, color=(255, 255, 255), is_strategy=False):
+        if is_strategy:
+            self._strategy_stack.append(txt)
+        try:
+            with self.visualizer.debug_log(txt, color) if self.visualizer is not None else contextlib.suppress():
+                yield
+        finally:
+            if is_strategy:
+                self._strategy_stack.pop()
 
     def get_summary(self):
         return {
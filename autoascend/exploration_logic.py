@@ -194,9 +194,13 @@ class ExplorationLogic:
         if self.agent.bfs()[y, x] == -1 or (self.agent.blstats.y, self.agent.blstats.x) == (y, x):
             yield False
         yield True
+        if not kwargs.get('fast'):
+            # avoid traps, shops and lines of fire on the way, instead of only walking around traps
+            kwargs.setdefault('cost', self.agent.movement_cost)
         return self.agent.go_to(y, x, *args, **kwargs)
 
     @Strategy.wrap
+    @Strategy.depends_on('turn', 'position', 'glyphs', 'level')
     def search_neighbors_for_traps(self, offset=0):
         search_count = 0
         level = self.agent.current_level()
@@ -220,6 +224,7 @@ class ExplorationLogic:
             self.agent.search()
 
     @Strategy.wrap
+    @Strategy.depends_on('position', 'level')
     def check_altar(self):
         level = self.agent.current_level()
         pos = (self.agent.blstats.y, self.agent.blstats.x)
@@ -463,6 +468,7 @@ class ExplorationLogic:
 
     @utils.debug_log('untrap_traps')
     @Strategy.wrap
+    @Strategy.depends_on('blstats', 'glyphs', 'level')
     def untrap_traps(self):
         if self.agent.blstats.hitpoints < 10 or (self.agent.blstats.hitpoints / self.agent.blstats.max_hitpoints) < 0.5:
             # not enough HP to risk untrapping at all
@@ -486,13 +492,13 @@ class ExplorationLogic:
             return
 
         trap_mask = cv2.dilate(trap_mask.astype(np.uint8), kernel=np.ones((3, 3))).astype(bool)
-        bfs = self.agent.bfs()
         trap_mask[self.agent.blstats.y, self.agent.blstats.x] = 0  # don't try to untrap when standing on it
-        trap_mask &= (bfs >= 0)
+        dis, _ = self.agent.bfs_nearest(trap_mask)
+        trap_mask &= (dis >= 0)
         if not trap_mask.any():
             yield False
             return
-        trap_mask &= bfs == bfs[trap_mask].min()
+        trap_mask &= dis == dis[trap_mask].min()
         assert trap_mask.any()
 
         if not trap_mask.any():
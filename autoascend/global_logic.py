@@ -165,14 +165,14 @@ class GlobalLogic:
 
     def update(self):
         if not self.agent.character.prop.hallu:
-            if utils.isin(self.agent.glyphs, G.ORACLE).any():
+            if self.agent.features.any(G.ORACLE):
                 if self.oracle_level is None:
                     self.oracle_level = self.agent.current_level().key()
                 else:
                     assert self.oracle_level == self.agent.current_level().key()
 
             if self.agent.current_level().dungeon_number == Level.GNOMISH_MINES and \
-                    utils.isin(self.agent.glyphs, G.SHOPKEEPER).any():
+                    self.agent.features.any(G.SHOPKEEPER):
                 if self.minetown_level is None:
                     self.minetown_level = self.agent.current_level().key()
                 else:
@@ -180,6 +180,7 @@ class GlobalLogic:
 
     @utils.debug_log('solving sokoban')
     @Strategy.wrap
+    @Strategy.depends_on('level')
     def solve_sokoban_strategy(self):
         # TODO: refactor
         if not utils.isin(self.agent.current_level().objects, G.TRAPS).any():
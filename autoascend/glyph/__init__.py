@@ -1,4 +1,5 @@
 import nle.nethack as nh
+import numpy as np
 
 from . import monster as MON
 from . import screen_symbols as SS
@@ -116,3 +117,14 @@ class G:  # Glyphs
 
 G.INV_DICT = {i: [k for k, v in G.DICT.items() if i in v]
               for i in set.union(*map(set, G.DICT.values()))}
+
+# one bit per `G` set -- see `utils.glyph_classes` and `utils.class_mask`
+assert len(G.DICT) <= 64, len(G.DICT)
+G.BITS = {}
+for _i, _v in enumerate(G.DICT.values()):
+    G.BITS[_v] = G.BITS.get(_v, 0) | (1 << _i)
+G.BIT_TABLE = np.zeros(nh.MAX_GLYPH, dtype=np.uint64)
+for _v, _bits in G.BITS.items():
+    for _glyph in _v:
+        G.BIT_TABLE[_glyph] |= np.uint64(_bits)
+del _i, _v, _bits, _glyph
@@ -635,7 +635,7 @@ class Inventory:
             # TODO: HACK
             self.agent.last_observation = self.agent.last_observation.copy()
             for key in ['inv_strs', 'inv_oclasses', 'inv_glyphs', 'inv_letters']:
-                self.agent.last_observation[key] = self.agent._observation[key].copy()
+                self.agent.last_observation[key] = self.agent._observation[key]
             self.items.update(force=True)
 
             ret = []
@@ -1227,7 +1227,8 @@ class Inventory:
         target_y, target_x = nonzero_y[i], nonzero_x[i]
 
         with self.agent.env.debug_tiles(mask, color=(255, 0, 0, 128)):
-            self.agent.go_to(target_y, target_x, debug_tiles_args=dict(color=(255, 0, 255), is_path=True))
+            self.agent.go_to(target_y, target_x, debug_tiles_args=dict(color=(255, 0, 255), is_path=True),
+                             cost=self.agent.movement_cost)
 
     @utils.debug_log('inventory.go_to_unchecked_containers')
     @Strategy.wrap
@@ -1255,7 +1256,8 @@ class Inventory:
         target_y, target_x = nonzero_y[i], nonzero_x[i]
 
         with self.agent.env.debug_tiles(mask, color=(255, 0, 0, 128)):
-            self.agent.go_to(target_y, target_x, debug_tiles_args=dict(color=(255, 0, 255), is_path=True))
+            self.agent.go_to(target_y, target_x, debug_tiles_args=dict(color=(255, 0, 255), is_path=True),
+                             cost=self.agent.movement_cost)
 
     @utils.debug_log('inventory.check_containers')
     @Strategy.wrap
@@ -1278,14 +1280,14 @@ class Inventory:
     @Strategy.wrap
     def go_to_item_to_pickup(self):
         level = self.agent.current_level()
-        dis = self.agent.bfs()
 
         # TODO: free (no charge) items
-        mask = ~level.shop_interior & (dis > 0)
+        mask = ~level.shop_interior & (level.item_count != 0)
         if not mask.any():
             yield False
 
-        mask[mask] = self.agent.current_level().item_count[mask] != 0
+        dis = self.agent.bfs()
+        mask &= dis > 0
 
         items = {}
         for y, x in sorted(zip(*mask.nonzero()), key=lambda p: dis[p]):
@@ -1319,7 +1321,8 @@ class Inventory:
             assert 0
 
         with self.agent.env.debug_tiles([(y, x) for _, (y, x) in items.items()], color=(255, 0, 0, 128)):
-            self.agent.go_to(target_y, target_x, debug_tiles_args=dict(color=(255, 0, 255), is_path=True))
+            self.agent.go_to(target_y, target_x, debug_tiles_args=dict(color=(255, 0, 255), is_path=True),
+                             cost=self.agent.movement_cost)
 
     @utils.debug_log('inventory.pickup_and_drop_items')
     @Strategy.wrap
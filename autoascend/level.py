@@ -46,6 +46,16 @@ class Level:
         # e.g. ad aerarium -- avoid valut entrance
         self.forbidden = np.zeros((C.SIZE_Y, C.SIZE_X), bool)
 
+        # should be incremented on every change of walkable, forbidden, objects or monster masks
+        # (see `Agent.walkability_masks`)
+        self.walkability_version = 0
+
+        # incremented only when walkable, objects or forbidden really change -- they should be written with
+        # `set_walkable`, `set_objects` and `set_forbidden`
+        self.terrain_version = 0
+        self._shop_entries = (-1, None)  # (terrain_version, mask)
+        self._shop_regions = (-1, [])  # (terrain_version, [mask])
+
     def key(self):
         return (self.dungeon_number, self.level_number)
 
@@ -64,3 +74,53 @@ class Level:
 
     def is_light_level(self):
         return np.sum(utils.isin(self.objects, [SS.S_room, SS.S_litcorr])) > 15
+
+    def shop_entries(self):
+        """ Walkable tiles between two walls, i.e. doors and broken doors """
+        version, entries = self._shop_entries
+        if version != self.terrain_version:
+            wall_mask = utils.isin(self.objects, G.WALL)
+            entries = ((utils.translate(wall_mask, 1, 0) & utils.translate(wall_mask, -1, 0)) |
+                       (utils.translate(wall_mask, 0, 1) & utils.translate(wall_mask, 0, -1))) & \
+                      self.walkable
+            entries.flags.writeable = False
+            self._shop_entries = (self.terrain_version, entries)
+        return entries
+
+    def set_walkable(self, index, value):
+        if (self.walkable[index] != value).any():
+            self.walkable[index] = value
+            self.terrain_version += 1
+
+    def set_objects(self, index, values):
+        if (self.objects[index] != values).any():
+            self.objects[index] = values
+            self.terrain_version += 1
+
+    def set_forbidden(self, index, value=True):
+        if (self.forbidden[index] != value).any():
+            self.forbidden[index] = value
+            self.terrain_version += 1
+
+    def shop_region(self, y, x):
+        """ Returns the mask of tiles reachable from (y, x) without crossing shop entries (see `shop_entries`).
+
+        Regions are cached until the terrain changes and reused for every source inside them, so a shopkeeper
+        walking around the shop doesn't cause a new BFS. They are shared and must not be modified in place.
+        """
+        version, regions = self._shop_regions
+        if version != self.terrain_version:
+            regions = []
+            self._shop_regions = (self.terrain_version, regions)
+        for region in regions:
+            if region[y, x]:
+                return region
+
+        entries = self.shop_entries()
+        walkable = self.walkable & ~entries
+        region = utils.bfs(y, x, walkable=walkable, walkable_diagonally=walkable, can_squeeze=False) != -1
+        region.flags.writeable = False
+        # a region searched from an entry spans both of its sides, so it isn't the region of its other tiles
+        if not entries[y, x]:
+            regions.append(region)
+        return region
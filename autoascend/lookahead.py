@@ -0,0 +1,91 @@
+import os
+
+from .exceptions import AgentFinished, AgentPanic
+from .snapshot import Snapshot, SnapshotError
+from .strategy import Strategy
+
+
+def _measure(env):
+    blstats = env.last_observation['blstats']
+    return {
+        'score': env.score,
+        'hitpoints': int(blstats[10]),
+        'depth': int(blstats[12]),
+        'turns': int(blstats[20]),
+        'steps': env.step_count,
+    }
+
+
+def _evaluate(env, candidate, steps):
+    if env.agent is not None:
+        # The snapshot may be taken inside running strategies. Their preempt hooks would take over the branch
+        # with `AgentChangeStrategy` that nothing here catches -- the strategies themselves don't run in it.
+        env.agent.on_update = []
+
+    before = _measure(env)
+    step_limit = env.step_limit
+    env.step_limit = env.step_count + steps - 1
+
+    panic = None
+    try:
+        if callable(candidate[0]):
+            func, *args = candidate
+            strategy = func(env.agent, *args)
+            if isinstance(strategy, Strategy):
+                strategy.run()
+        else:
+            for action in candidate:
+                if env.agent is not None:
+                    env.agent.step(action)
+                else:
+                    env.step(action)
+                    if env.is_done:
+                        break
+    except AgentFinished:
+        pass
+    except AgentPanic as e:
+        panic = str(e)
+    finally:
+        env.step_limit = step_limit
+
+    after = _measure(env)
+    return {
+        **{k: after[k] - before[k] for k in after},
+        'finished': env.is_done and env.end_reason != 'steplimit',
+        'end_reason': env.end_reason if env.end_reason != 'steplimit' else '',
+        'panic': panic,
+        'error': None,
+    }
+
+
+class ForkPool:
+    """
+    Lookahead search over branches of the current game state (see `Snapshot`).
+
+    A candidate is either a sequence of actions, or a tuple `(func, *args)` where `func(agent, *args)` performs
+    the actions itself or returns a `Strategy` to run. Every candidate is run in its own branch for at most `steps`
+    steps and reported as deltas of score, hitpoints, depth, turns and steps, e.g.:
+    ```
+    with ForkPool(env) as pool:
+        deltas = pool.evaluate([[A.Command.SEARCH] * 5, (Agent.fight2, monster)], steps=50)
+    ```
+    Branches of one pool run on at most `processes` cores and reuse their vardirs. A failed branch doesn't abort
+    the others, it's reported as `{'error': message}`.
+    """
+
+    def __init__(self, env, processes=None):
+        self.snapshot = Snapshot(env, slots=processes or os.cpu_count())
+
+    def evaluate(self, candidates, steps, timeout=None):
+        results = self.snapshot.map(_evaluate, [(candidate, steps) for candidate in candidates], timeout=timeout,
+                                    return_exceptions=True)
+        return [{'error': str(r)} if isinstance(r, SnapshotError) else r for r in results]
+
+    def close(self):
+        self.snapshot.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
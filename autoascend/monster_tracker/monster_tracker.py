@@ -4,7 +4,6 @@ import numpy as np
 from nle.nethack import actions as A
 
 from .kernels import figure_out_monster_movement
-from .. import utils
 from ..exceptions import AgentPanic
 from ..glyph import C, G
 
@@ -20,7 +19,7 @@ class MonsterTracker:
         self.monster_mask = np.zeros((C.SIZE_Y, C.SIZE_X), bool)
 
     def take_all_monsters(self):
-        if utils.any_in(self.agent.glyphs, G.SWALLOW):
+        if self.agent.features.any(G.SWALLOW):
             return {}
         with self.agent.atom_operation():
             self.agent.step(A.Command.WHATIS, iter(['M']))
@@ -46,9 +45,9 @@ class MonsterTracker:
         return monsters
 
     def _get_current_masks(self):
-        new_monster_mask = utils.isin(self.agent.glyphs, G.MONS, G.INVISIBLE_MON)
+        new_monster_mask = self.agent.features.mask(G.MONS, G.INVISIBLE_MON).copy()
         new_monster_mask[self.agent.blstats.y, self.agent.blstats.x] = 0
-        pet_mask = utils.isin(self.agent.glyphs, G.PETS)
+        pet_mask = self.agent.features.pets
 
         return new_monster_mask, pet_mask
 
@@ -83,4 +82,5 @@ class MonsterTracker:
         # TODO: on hallu no monsters are peaceful
 
         assert (~self.peaceful_monster_mask | self.monster_mask).all()
-        self._last_glyphs = self.agent.glyphs.copy()
+        self._last_glyphs = self.agent.glyphs  # not recycled while referenced, see ObservationStore
+        self.agent.current_level().walkability_version += 1
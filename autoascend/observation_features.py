@@ -0,0 +1,57 @@
+from . import utils
+from .glyph import G
+
+
+class ObservationFeatures:
+    """ Glyph masks derived from a single observation.
+
+    Masks and coordinate lists are computed on first use and memoized, so the subsystems asking for
+    the same mask within one step share the work. Returned arrays are read-only.
+    """
+
+    def __init__(self, glyphs, classes=None):
+        self.glyphs = glyphs
+        self.classes = utils.glyph_classes(glyphs) if classes is None else classes
+        self._masks = {}
+        self._coords = {}
+
+    def mask(self, *elems):
+        """ Same as `utils.isin(glyphs, *elems)`, elems must be `G` sets """
+        if elems not in self._masks:
+            mask = utils.class_mask(self.classes, *elems)
+            mask.flags.writeable = False
+            self._masks[elems] = mask
+        return self._masks[elems]
+
+    def coords(self, *elems):
+        """ Returns list of (y, x) of glyphs from any of elems """
+        if elems not in self._coords:
+            self._coords[elems] = list(zip(*self.mask(*elems).nonzero()))
+        return self._coords[elems]
+
+    def any(self, *elems):
+        return len(self.coords(*elems)) > 0
+
+    @property
+    def monsters(self):
+        return self.mask(G.MONS)
+
+    @property
+    def pets(self):
+        return self.mask(G.PETS)
+
+    @property
+    def swallow(self):
+        return self.mask(G.SWALLOW)
+
+    @property
+    def boulders(self):
+        return self.mask(G.BOULDER)
+
+    @property
+    def shopkeepers(self):
+        return self.mask(G.SHOPKEEPER)
+
+    @property
+    def oracle(self):
+        return self.mask(G.ORACLE)
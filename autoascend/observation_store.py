@@ -0,0 +1,43 @@
+import sys
+
+import numpy as np
+
+
+class ObservationStore:
+    """ Copies the observation keys the agent reads into recycled buffers.
+
+    The env reuses its observation arrays between steps, so the agent has to keep copies. Instead of
+    allocating new arrays every step, a buffer handed out earlier is overwritten once nothing but
+    the store references it anymore (e.g. `_previous_glyphs` or a cached view still keeps it alive).
+
+    The buffers stay writable: numba kernels compiled with explicit signatures (e.g. `_isin_kernel`) don't
+    accept read-only arrays.
+    """
+
+    KEYS = ('glyphs', 'blstats', 'specials', 'message', 'misc', 'tty_chars', 'tty_cursor',
+            'inv_strs', 'inv_oclasses', 'inv_glyphs', 'inv_letters')
+    MAX_BUFFERS = 8  # per key, buffers held longer than that are left to the garbage collector
+
+    def __init__(self, keys=KEYS):
+        self.keys = keys
+        self._buffers = {key: [] for key in keys}
+
+    def copy(self, observation):
+        return {key: self._copy(key, observation[key]) for key in self.keys}
+
+    def _copy(self, key, array):
+        buffers = self._buffers[key]
+        for i in range(len(buffers)):
+            # the only references are `buffers` and the getrefcount argument
+            if sys.getrefcount(buffers[i]) <= 2 and buffers[i].shape == array.shape and \
+                    buffers[i].dtype == array.dtype:
+                buf = buffers.pop(i)
+                break
+        else:
+            buf = np.empty_like(array)
+            if len(buffers) >= self.MAX_BUFFERS:
+                del buffers[0]
+
+        np.copyto(buf, array)
+        buffers.append(buf)
+        return buf
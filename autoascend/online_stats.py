@@ -0,0 +1,148 @@
+import bisect
+from collections import Counter
+
+import numpy as np
+
+
+class RunningStats:
+    """ Count, sum, mean and variance updated per value (Welford's algorithm) """
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, x):
+        self.count += 1
+        self.sum += x
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (x - self.mean)
+
+    @property
+    def std(self):
+        return (self._m2 / self.count) ** 0.5 if self.count else float('nan')
+
+
+class P2Quantile:
+    """
+    Streaming estimate of the `p` quantile in O(1) memory and time per value
+    (the P-square algorithm of Jain and Chlamtac). Exact for the first five values.
+    """
+
+    def __init__(self, p):
+        self.p = p
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x):
+        q, n = self.heights, self.positions
+        if len(q) < 5:
+            bisect.insort(q, x)
+            return
+
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = bisect.bisect_right(q, x) - 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self._parabolic(i, d)
+                if not q[i - 1] < height < q[i + 1]:
+                    height = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    def _parabolic(self, i, d):
+        q, n = self.heights, self.positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+                (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+                (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+
+    @property
+    def value(self):
+        if len(self.heights) < 5:
+            return np.quantile(self.heights, self.p) if self.heights else float('nan')
+        return self.heights[2]
+
+
+class Reservoir:
+    """ Uniform sample of at most `size` values of a stream (reservoir sampling) """
+
+    def __init__(self, size=1024, seed=0):
+        self.size = size
+        self.values = []
+        self.count = 0
+        self.rng = np.random.RandomState(seed)
+
+    def add(self, x):
+        self.count += 1
+        if len(self.values) < self.size:
+            self.values.append(x)
+        else:
+            i = self.rng.randint(self.count)
+            if i < self.size:
+                self.values[i] = x
+
+    def bootstrap_median_std(self, num_samples=1024):
+        """
+        Standard deviation of the median of `count // 2` values sampled with replacement. Samples are drawn from
+        the reservoir, so for large counts the result is rescaled from the reservoir size (the std of the median
+        falls with the square root of the sample size).
+        """
+        if not self.values:
+            return float('nan')
+        sample_size = max(1, self.count // 2)
+        drawn_size = min(sample_size, len(self.values))
+        medians = np.median(self.rng.choice(self.values, size=(num_samples, drawn_size)), axis=1)
+        return np.std(medians) * (drawn_size / sample_size) ** 0.5
+
+
+class SimulationStats:
+    """ Statistics of finished episodes for the simulation report, updated in O(1) per episode """
+
+    QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+    def __init__(self):
+        self.count = 0
+        self.duration = RunningStats()
+        self.turns = RunningStats()
+        self.score = RunningStats()
+        self.panic_num = RunningStats()
+        self.panic_num_median = P2Quantile(0.5)
+        self.score_quantiles = {p: P2Quantile(p) for p in self.QUANTILES}
+        self.score_reservoir = Reservoir()
+        self.end_reasons = Counter()
+
+    def add(self, result):
+        self.count += 1
+        self.duration.add(result['duration'])
+        self.turns.add(result['turns'])
+        self.score.add(result['score'])
+        self.panic_num.add(result['panic_num'])
+        self.panic_num_median.add(result['panic_num'])
+        for quantile in self.score_quantiles.values():
+            quantile.add(result['score'])
+        self.score_reservoir.add(result['score'])
+
+        end_reason = result['end_reason']
+        if end_reason.startswith('exception:'):
+            self.end_reasons['exceptions'] += 1
+        if end_reason.startswith('steplimit') or end_reason.startswith('ABORT'):
+            self.end_reasons['steplimit'] += 1
+        if end_reason.startswith('timeout'):
+            self.end_reasons['timeout'] += 1
@@ -0,0 +1,113 @@
+import json
+import os
+from pathlib import Path
+
+
+def _append_line(path, line):
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, (line + '\n').encode())
+    finally:
+        os.close(fd)
+
+
+def _seed(result):
+    seed = result['seed']
+    return seed[0] if isinstance(seed, (list, tuple)) else seed
+
+
+class ResultsStore:
+    """
+    Append-only store of simulation results, one JSON line per finished episode.
+
+    Every `append` is a single `os.write` to a file opened with O_APPEND, so a crashed or killed coordinator leaves
+    at most one truncated last line, which is skipped when loading. An episode rerun for the same seed just appends
+    a new record -- the last record of a seed wins.
+
+    Next to the results, `<path>.index` lists `<seed> <exception 0/1>` per record, so that resuming doesn't need
+    to parse the results. Legacy `.json` files (a dict of lists, as written by older versions) can be loaded too.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.index_path = self.path.with_name(self.path.name + '.index')
+
+    def append(self, result):
+        assert self.path.suffix != '.json', 'legacy results files are read-only'
+        result = {k: v if not hasattr(v, 'item') else v.item() for k, v in result.items()}
+        _append_line(self.path, json.dumps(result))
+        self.append_index(result)
+
+    def done_seeds(self, with_exceptions=True):
+        """ Seeds of the episodes in the store. The index is rebuilt if it's missing """
+        if not self.index_path.exists():
+            if not self.path.exists():
+                return set()
+            for result in self.records():
+                self.append_index(result)
+
+        seeds = {}
+        with self.index_path.open() as f:
+            for line in f:
+                elems = line.split()
+                if len(elems) == 2:
+                    seeds[int(elems[0])] = elems[1] == '1'
+        return {seed for seed, exception in seeds.items() if with_exceptions or not exception}
+
+    def append_index(self, result):
+        exception = result.get('end_reason', '').startswith('exception')
+        _append_line(self.index_path, f'{_seed(result)} {int(exception)}')
+
+    def records(self):
+        """ All records in the order of appending (including superseded ones) """
+        if not self.path.exists():
+            return []
+
+        if self.path.suffix == '.json':
+            with self.path.open() as f:
+                columns = json.load(f)
+            return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+        records = []
+        with self.path.open() as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # truncated by an interrupted write
+                    pass
+        return records
+
+    def load(self, records=None):
+        """ Returns the latest result per seed as a dict of lists (the same layout as the legacy json file).
+        Keys missing in some records (e.g. written by an older version) are filled with None.
+        `records` can be passed if they were already read with `records()`.
+        """
+        latest = {}
+        for result in self.records() if records is None else records:
+            latest.pop(_seed(result), None)
+            latest[_seed(result)] = result
+
+        keys = {}
+        for result in latest.values():
+            keys.update(dict.fromkeys(result))
+        return {key: [result.get(key) for result in latest.values()] for key in keys}
+
+
+def load_results(path):
+    return ResultsStore(path).load()
+
+
+def writable_store(path):
+    """ Returns a store that can be appended to. A legacy `.json` file is migrated (once) to a `.jsonl` file
+    next to it, which is returned instead.
+    """
+    store = ResultsStore(path)
+    if store.path.suffix != '.json':
+        return store
+
+    new_store = ResultsStore(store.path.with_suffix('.jsonl'))
+    if not new_store.path.exists():
+        for result in store.records():
+            new_store.append(result)
+    return new_store
@@ -0,0 +1,201 @@
+import gc
+import itertools
+import multiprocessing
+import os
+import shutil
+import signal
+import tempfile
+import traceback
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class Snapshot:
+    """
+    A frozen copy of the whole env + agent state, from which any number of branches can be run.
+
+    The NetHack game lives in the memory of the NLE library, so neither the vardir nor a pickled agent is
+    enough to restore it. Instead, the snapshot is a forked process that only waits for requests. Every request
+    forks it again, so each branch starts from exactly the same memory (shared copy-on-write) with its own copy
+    of the vardir, which the snapshot keeps in tmpfs. Branches run `func(env, *args)` and send back the result.
+
+    `func` and its arguments are pickled, so they have to be module level functions (or e.g. `Agent.method`).
+
+    With `slots`, at most that many branches run at once and each of them reuses the vardir of its slot.
+    A finished branch only brings back the files it changed, instead of copying the whole vardir again.
+
+    ```
+    with env.snapshot() as snapshot:
+        results = snapshot.map(evaluate_fight, [(target,) for target in targets])
+    ```
+    """
+
+    TMPFS = '/dev/shm'
+
+    def __init__(self, env, slots=None):
+        self._vardir = tempfile.mkdtemp(prefix='nlesnapshot_', dir=self.TMPFS if os.path.isdir(self.TMPFS) else None)
+        shutil.copytree(env.env._vardir, self._vardir, dirs_exist_ok=True)
+        self._lock = multiprocessing.Lock()  # for sending results from concurrent branches
+        self._conn, child_conn = multiprocessing.Pipe()
+        self._ids = itertools.count()
+        self._results = {}
+        self.slots = slots
+        self._free_slots = list(range(slots)) if slots is not None else None
+        self._slots = {}  # iden -> slot
+        gc.collect()
+
+        self._pid = os.fork()
+        if self._pid == 0:
+            # the snapshot process
+            self._conn.close()
+            try:
+                self._serve(env, child_conn)
+            finally:
+                os._exit(0)
+        child_conn.close()
+
+    def _serve(self, env, conn):
+        signal.signal(signal.SIGCHLD, signal.SIG_IGN)  # branches are reaped automatically
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        while 1:
+            try:
+                request = conn.recv()
+            except EOFError:
+                return
+            if request is None:
+                return
+            if os.fork() == 0:
+                signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                try:
+                    self._run_branch(env, conn, *request)
+                finally:
+                    os._exit(0)
+
+    def _slot_vardir(self, slot):
+        return f'{self._vardir}_{slot}'
+
+    def _restore_vardir(self, vardir):
+        """ Brings the files changed by a branch back to the snapshot state """
+        for root, dirs, files in os.walk(vardir):
+            for name in files:
+                path = os.path.join(root, name)
+                if not os.path.exists(os.path.join(self._vardir, os.path.relpath(path, vardir))):
+                    os.remove(path)
+        for root, dirs, files in os.walk(self._vardir):
+            os.makedirs(os.path.join(vardir, os.path.relpath(root, self._vardir)), exist_ok=True)
+            for name in files:
+                src = os.path.join(root, name)
+                dst = os.path.join(vardir, os.path.relpath(src, self._vardir))
+                src_stat = os.stat(src)
+                try:
+                    dst_stat = os.stat(dst)
+                    if (src_stat.st_size, src_stat.st_mtime_ns) == (dst_stat.st_size, dst_stat.st_mtime_ns):
+                        continue
+                except FileNotFoundError:
+                    pass
+                shutil.copy2(src, dst)
+
+    def _run_branch(self, env, conn, iden, func, args, slot):
+        # The visualizer and the trace recorder share open files with the original process. References are
+        # kept until `os._exit` so that nothing is flushed or closed from here.
+        detached = env.visualizer, env.recorder
+        env.visualizer = env.recorder = None
+        env.interactive = False
+        env.to_skip = 0
+
+        if slot is None:
+            vardir = tempfile.mkdtemp(prefix='nlebranch_', dir=os.path.dirname(self._vardir))
+            shutil.copytree(self._vardir, vardir, dirs_exist_ok=True)
+        else:
+            vardir = self._slot_vardir(slot)
+            if not os.path.exists(vardir):
+                shutil.copytree(self._vardir, vardir)
+        try:
+            env.env._vardir = vardir
+            os.chdir(vardir)
+            try:
+                result = (True, func(env, *args))
+            except BaseException:
+                result = (False, traceback.format_exc())
+        finally:
+            if slot is None:
+                shutil.rmtree(vardir, ignore_errors=True)
+            else:
+                self._restore_vardir(vardir)
+        with self._lock:
+            conn.send((iden, result))
+        del detached
+
+    def submit(self, func, *args):
+        """ Starts a branch. Returns its id for `result` """
+        iden = next(self._ids)
+        slot = None
+        if self._free_slots is not None:
+            while not self._free_slots:
+                self._receive()
+            slot = self._slots[iden] = self._free_slots.pop()
+        self._conn.send((iden, func, args, slot))
+        return iden
+
+    def _receive(self, timeout=None):
+        if not self._conn.poll(timeout):
+            return False
+        i, result = self._conn.recv()
+        self._results[i] = result
+        if i in self._slots:
+            self._free_slots.append(self._slots.pop(i))
+        return True
+
+    def result(self, iden, timeout=None):
+        while iden not in self._results:
+            if not self._receive(timeout):
+                raise SnapshotError(f'branch {iden} timed out')
+
+        success, value = self._results.pop(iden)
+        if not success:
+            raise SnapshotError(f'branch {iden} failed:\n{value}')
+        return value
+
+    def run(self, func, *args, timeout=None):
+        return self.result(self.submit(func, *args), timeout=timeout)
+
+    def map(self, func, args_list, processes=None, timeout=None, return_exceptions=False):
+        """ Runs `func(env, *args)` for every `args` in separate branches, at most `processes` at once.
+        With `return_exceptions`, a failed branch is returned as its `SnapshotError` instead of raising it.
+        """
+        processes = processes or self.slots or os.cpu_count()
+        args_list = list(args_list)
+        idens = [self.submit(func, *args) for args in args_list[:processes]]
+        results = []
+        for i in range(len(args_list)):
+            try:
+                results.append(self.result(idens[i], timeout=timeout))
+            except SnapshotError as e:
+                if not return_exceptions:
+                    raise
+                results.append(e)
+            if len(idens) < len(args_list):
+                idens.append(self.submit(func, *args_list[len(idens)]))
+        return results
+
+    def close(self):
+        if self._pid is None:
+            return
+        try:
+            self._conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self._conn.close()
+        os.waitpid(self._pid, 0)
+        self._pid = None
+        shutil.rmtree(self._vardir, ignore_errors=True)
+        for slot in range(self.slots or 0):
+            shutil.rmtree(self._slot_vardir(slot), ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -37,6 +37,8 @@ class StatsLogger:
 
         self.gold = []
 
+        self.strategy_profiler = None
+
     def log_cumulative_value(self, name, key, value):
         self._cumulative_values[name][key] += value
 
@@ -65,4 +67,7 @@ class StatsLogger:
                     ret['gold_' + stat] = self.gold[-1]
                 else:
                     assert 0, stat
+
+        if self.strategy_profiler is not None:
+            ret['strategy_stats'] = self.strategy_profiler.get_stats()
         return ret
@@ -1,4 +1,9 @@
-from functools import wraps
+import re
+import time
+from collections import defaultdict
+from functools import partial, wraps
+
+from .exceptions import AgentChangeStrategy
 
 
 class Strategy:
@@ -27,50 +32,144 @@ class Strategy:
     ```
     """
 
+    profiler = None  # StrategyProfiler, if enabled
+
     @classmethod
     def wrap(cls, func):
         return lambda *a, **k: Strategy(wraps(func)(lambda: func(*a, **k)))
 
+    @staticmethod
+    def depends_on(*dependencies):
+        """
+        Declare the state the condition of a strategy function depends on (see `Agent.dependency_versions`).
+        A false condition is remembered per arguments and the function isn't called again until the version
+        of one of the dependencies changes. Used for execution time optimization.
+
+        ```
+        @Strategy.wrap
+        @Strategy.depends_on('position', 'level')
+        def check_altar(self):
+            ...
+        ```
+        """
+        def decorator(func):
+            @wraps(func)
+            def wrapper(self, *args, **kwargs):
+                agent = self if type(self).__name__ == 'Agent' else self.agent
+                key = (func.__qualname__, args, tuple(sorted(kwargs.items())))
+                versions = agent.dependency_versions(dependencies)
+                if agent.false_conditions.get(key) == versions:
+                    yield False
+                    assert 0
+
+                gen = func(self, *args, **kwargs)
+                if not next(gen):
+                    agent.false_conditions[key] = versions
+                    yield False
+                    assert 0
+                agent.false_conditions.pop(key, None)
+                yield True
+
+                try:
+                    next(gen)
+                    assert 0, gen
+                except StopIteration as e:
+                    return e.value
+
+            return wrapper
+
+        return decorator
+
     def __init__(self, strategy, config=None):
-        self.strategy = strategy
-        if config is None:
-            self.config = str(self.strategy)
-        else:
-            self.config = config
+        # Combinators don't wrap generators in closures. They create nodes (`kind` with the `inner` strategy
+        # and an argument) evaluated by `_interpret`, and their configs are built only when needed.
+        self.kind = 'leaf'
+        self.inner = None
+        self.arg = None
+        self._func = strategy
+        self._config = config
+        self._counter = -1  # for 'every'
+
+    @classmethod
+    def _node(cls, kind, inner, arg=None, func=None):
+        node = cls(func)
+        node.kind = kind
+        node.inner = inner
+        node.arg = arg
+        return node
+
+    @property
+    def strategy(self):
+        """ Function returning the generator of the strategy """
+        if self._func is None:
+            return partial(_interpret, self)
+        return self._func
+
+    @strategy.setter
+    def strategy(self, func):
+        # the node becomes opaque for the interpreter, the config stays
+        self._config = self.config
+        self._func = func
+
+    @property
+    def config(self):
+        if self._config is None:
+            if self.kind == 'leaf':
+                self._config = str(self._func)
+            elif self.kind == 'condition':
+                self._config = {'strategy': self.inner.config, 'condition': str(self.arg)}
+            elif self.kind == 'until':
+                self._config = {'strategy': self.inner.config, 'until': str(self.arg)}
+            elif self.kind == 'before':
+                self._config = {'1': self.inner.config, '2': self.arg.config}
+            elif self.kind == 'preempt':
+                self._config = {'strategy': self.inner.config, 'preempt': [s.config for s in self.arg]}
+            elif self.kind == 'repeat':
+                self._config = {'repeat': self.inner.config}
+            elif self.kind == 'every':
+                self._config = {'strategy': self.inner.config, 'every': self.arg}
+            else:
+                assert 0, self.kind
+        return self._config
+
+    @config.setter
+    def config(self, config):
+        self._config = config
 
     def run(self, return_condition=False):
         gen = self.strategy()
-        if not next(gen):
+        if not self.next_condition(gen):
             if return_condition:
                 return False
             return None
-        try:
-            next(gen)
-            assert 0
-        except StopIteration as e:
-            if return_condition:
-                return True
-            return e.value
+        value = self.finish(gen)
+        if return_condition:
+            return True
+        return value
 
     def check_condition(self):
         gen = self.strategy()
+        return self.next_condition(gen)
+
+    def next_condition(self, gen):
+        """ Returns the condition yielded by `gen` (a generator of this strategy) """
+        if Strategy.profiler is not None:
+            return Strategy.profiler.condition(self, gen)
         return next(gen)
 
+    def finish(self, gen):
+        """ Runs the strategy body after a passed condition and returns its value """
+        if Strategy.profiler is not None:
+            return Strategy.profiler.body(self, gen)
+        try:
+            next(gen)
+            assert 0, gen
+        except StopIteration as e:
+            return e.value
+
     def condition(self, condition):
         """ Add additional condition for entering the strategy """
-        def f(self=self, condition=condition):
-            if not condition():
-                yield False
-                assert 0
-            it = self.strategy()
-            yield next(it)
-            try:
-                next(it)
-                assert 0
-            except StopIteration as e:
-                return e.value
-
-        return Strategy(f, {'strategy': self.config, 'condition': str(condition)})
+        return Strategy._node('condition', self, condition)
 
     def until(self, agent, condition):
         """ Run the strategy until condition """
@@ -82,46 +181,22 @@ class Strategy:
 
         strategy = self.condition(lambda: not condition()).preempt(agent, [Strategy(f)],
                                                                    continue_after_preemption=False)
-        strategy.config = {'strategy': self.config, 'until': str(condition)}
-        return strategy
+        return Strategy._node('until', self, condition, func=strategy.strategy)
 
     def before(self, strategy):
         """ Stack sequentially two strategies """
-        def f(self=self, strategy=strategy):
-            yielded = False
-            r1, r2 = None, None
-
-            v1 = self.strategy()
-            if next(v1):
-                if not yielded:
-                    yielded = True
-                    yield True
-                try:
-                    next(v1)
-                    assert 0, v1
-                except StopIteration as e:
-                    r1 = e.value
-
-            v2 = strategy.strategy()
-            if next(v2):
-                if not yielded:
-                    yielded = True
-                    yield True
-                try:
-                    next(v2)
-                    assert 0, v2
-                except StopIteration as e:
-                    r2 = e.value
-
-            if not yielded:
-                yield False
-
-            return (r1, r2)
-
-        return Strategy(f, {'1': self.config, '2': strategy.config})
+        return Strategy._node('before', self, strategy)
 
     def preempt(self, agent, strategies, continue_after_preemption=True):
         """ Specify other strategies that may preempt the strategy """
+        if continue_after_preemption:
+            # chained preempt layers are flattened into a single priority table
+            if isinstance(self.strategy, PriorityTable) and self.strategy.agent is agent:
+                table = PriorityTable(agent, self.strategy.base, [list(strategies)] + self.strategy.rows)
+            else:
+                table = PriorityTable(agent, self, [list(strategies)])
+            return Strategy._node('preempt', self, strategies, func=table)
+
         def f(self=self, agent=agent, strategies=strategies):
             gen = self.strategy()
             condition_passed = False
@@ -143,56 +218,238 @@ class Strategy:
 
             return agent.preempt(strategies, self, first_func=f2, continue_after_preemption=continue_after_preemption)
 
-        return Strategy(f, {'strategy': self.config, 'preempt': [s.config for s in strategies]})
+        return Strategy._node('preempt', self, strategies, func=f)
 
     def repeat(self):
         """ Repeat strategy until the condition is true """
-        def f(self=self):
-            yielded = False
-            val = None
-            while 1:
-                gen = self.strategy()
-                if not next(gen):
-                    if not yielded:
-                        yield False
-                    return
-
-                if not yielded:
-                    yielded = True
-                    yield True
-
-                try:
-                    next(gen)
-                    assert 0, gen
-                except StopIteration as e:
-                    val = e.value
-            return val
-
-        return Strategy(f, {'repeat': self.config})
+        return Strategy._node('repeat', self)
 
     def every(self, num_of_iterations):
         """
         Check the condition only every `num_of_iterations` iterations. Otherwise assume false.
         Used for execution time optimization.
         """
-        current_num = -1
+        return Strategy._node('every', self, num_of_iterations)
 
-        def f():
-            nonlocal current_num
-            current_num += 1
-            if current_num % num_of_iterations != 0:
+    def __repr__(self):
+        return str(self.config)
+
+
+def _finish(gen):
+    try:
+        next(gen)
+        assert 0, gen
+    except StopIteration as e:
+        return e.value
+
+
+def _interpret(node):
+    """ Generator of a combinator node. Chains of `condition` and `every` nodes are walked in a loop
+    within this single frame, instead of stacking a generator per combinator.
+    """
+    entered = []  # `every` nodes to reset when the strategy is entered
+    while node._func is None and node.kind in ('condition', 'every'):
+        if node.kind == 'condition':
+            if not node.arg():
                 yield False
                 assert 0
-            it = self.strategy()
-            yield next(it)
-            current_num = -1
-            try:
-                next(it)
+        else:
+            node._counter += 1
+            if node._counter % node.arg != 0:
+                yield False
                 assert 0
-            except StopIteration as e:
-                return e.value
+            entered.append(node)
+        node = node.inner
+
+    if node._func is not None:
+        gen = node._func()
+        yield next(gen)
+        for n in entered:
+            n._counter = -1
+        return _finish(gen)
+
+    elif node.kind == 'before':
+        yielded = False
+        r1, r2 = None, None
+
+        v1 = node.inner.strategy()
+        if next(v1):
+            yielded = True
+            yield True
+            for n in entered:
+                n._counter = -1
+            r1 = _finish(v1)
 
-        return Strategy(f, {'strategy': self.config, 'every': num_of_iterations})
+        v2 = node.arg.strategy()
+        if next(v2):
+            if not yielded:
+                yielded = True
+                yield True
+                for n in entered:
+                    n._counter = -1
+            r2 = _finish(v2)
 
-    def __repr__(self):
-        return str(self.config)
+        if not yielded:
+            yield False
+
+        return (r1, r2)
+
+    elif node.kind == 'repeat':
+        yielded = False
+        while 1:
+            gen = node.inner.strategy()
+            if not next(gen):
+                if not yielded:
+                    yield False
+                return None
+
+            if not yielded:
+                yielded = True
+                yield True
+                for n in entered:
+                    n._counter = -1
+
+            _finish(gen)
+
+    else:
+        assert 0, node.kind
+
+
+class PriorityTable:
+    """
+    A chain of `Strategy.preempt` layers run as one flat table of preempting strategies.
+
+    `rows` are ordered from the highest priority (the outermost `preempt` call). Strategies in one row are
+    equal, i.e. they don't preempt each other. While the base strategy or a strategy from row `i` runs,
+    the conditions of rows above `i` are checked after every step (with early exit) and the first passing one
+    takes over. When it finishes, the base condition and the rows below it are checked again -- the same
+    order in which nested `Agent.preempt` calls would re-enter.
+
+    Interrupting a running body still has to unwind its stack with `AgentChangeStrategy`, but it is raised
+    and caught once by the table, instead of being routed through a handler and a closure per layer.
+    """
+
+    def __init__(self, agent, base, rows):
+        self.agent = agent
+        self.base = base
+        self.rows = rows
+
+    def __call__(self):
+        gen = self.base.strategy()
+        with self.agent.disallow_step_calling():
+            condition_passed = next(gen)
+
+        if not condition_passed:
+            yield False
+        yield True
+
+        assert not self.agent._no_step_calls
+        return self._run(gen)
+
+    def _first_passing(self, start, stop):
+        for row in range(start, stop):
+            for strategy in self.rows[row]:
+                it = strategy.strategy()
+                if strategy.next_condition(it):
+                    return row, (strategy, it)
+        return None
+
+    def _run(self, base_gen):
+        agent = self.agent
+        iden = object()
+        active_rows = len(self.rows)
+
+        def on_update():
+            preempting = self._first_passing(0, active_rows)
+            if preempting is not None:
+                raise AgentChangeStrategy(iden, preempting)
+
+        preempting = None
+        start = 0
+        last_step = agent.step_count
+        inactivity_counter = 0
+        while 1:
+            try:
+                with agent.add_on_update([on_update]):
+                    if preempting is not None:
+                        active_rows, (strategy, it) = preempting
+                        preempting = None
+                        strategy.finish(it)
+                        start = active_rows + 1
+                        continue
+
+                    inactivity_counter += 1
+                    if agent.step_count != last_step:
+                        last_step = agent.step_count
+                        inactivity_counter = 0
+                    assert inactivity_counter < 5, 'cyclic preempt'
+
+                    with agent.disallow_step_calling():
+                        if base_gen is None:
+                            base_gen = self.base.strategy()
+                            if not next(base_gen):
+                                return None
+                        preempting = self._first_passing(start, len(self.rows))
+                    if preempting is not None:
+                        base_gen = None
+                        continue
+
+                    active_rows = len(self.rows)
+                    try:
+                        next(base_gen)
+                        assert 0, base_gen
+                    except StopIteration as e:
+                        return e.value
+
+            except AgentChangeStrategy as e:
+                if e.args[0] is not iden:
+                    raise
+                preempting = e.args[1]
+                base_gen = None
+
+
+class StrategyProfiler:
+    """
+    Records per strategy `config`: number of condition evaluations, how many of them passed,
+    and cumulative wall time spent in conditions and in bodies (including nested strategies).
+    Enabled by setting `Strategy.profiler`.
+    """
+
+    def __init__(self):
+        self._stats = defaultdict(lambda: [0, 0, 0.0, 0.0])  # name -> [count, true_count, cond_time, body_time]
+
+    @staticmethod
+    def name(strategy):
+        if getattr(strategy, '_profiler_name', None) is None:
+            # function addresses differ between processes
+            strategy._profiler_name = re.sub(r'<function ([^ ]+) at 0x[0-9a-f]+>', r'\1', str(strategy.config))
+        return strategy._profiler_name
+
+    def condition(self, strategy, gen):
+        start = time.perf_counter()
+        value = None
+        try:
+            value = next(gen)
+            return value
+        finally:
+            stats = self._stats[self.name(strategy)]
+            stats[0] += 1
+            stats[1] += bool(value)
+            stats[2] += time.perf_counter() - start
+
+    def body(self, strategy, gen):
+        start = time.perf_counter()
+        try:
+            next(gen)
+            assert 0, gen
+        except StopIteration as e:
+            return e.value
+        finally:
+            self._stats[self.name(strategy)][3] += time.perf_counter() - start
+
+    def get_stats(self):
+        return {name: {'count': count,
+                       'true_rate': true_count / count if count else 0.0,
+                       'condition_time': cond_time,
+                       'body_time': body_time}
+                for name, (count, true_count, cond_time, body_time) in self._stats.items()}
@@ -0,0 +1,165 @@
+import json
+from pathlib import Path
+
+import numpy as np
+
+from .glyph import C
+
+MESSAGE_SIZE = 256
+BLSTATS_SIZE = 27
+
+
+def step_dtype(blstats_size=BLSTATS_SIZE, message_size=MESSAGE_SIZE):
+    return np.dtype([
+        ('action', np.int32),  # -1 for the observation after reset
+        ('strategy', np.int32),  # index in the strategy table, -1 if none
+        ('blstats', np.int64, (blstats_size,)),
+        ('message', np.uint8, (message_size,)),
+        ('glyphs_offset', np.int64),  # in int16 units of glyphs.bin
+        ('glyphs_count', np.int32),  # keyframe: -1, otherwise number of changed cells
+    ])
+
+
+class TraceRecorder:
+    """
+    Appends per step glyphs, blstats, action, message and active strategy to a binary trace directory:
+
+    steps.bin -- fixed size records (see `step_dtype`), memory-mappable
+    glyphs.bin -- int16 glyph payloads. Every `keyframe_every` steps the full map is stored,
+                  otherwise (flat index, glyph) pairs of the cells changed since the previous step
+    meta.json -- shapes and the strategy table
+
+    Records are buffered and written in chunks of `chunk_size` steps.
+    """
+
+    def __init__(self, path, chunk_size=1024, keyframe_every=256):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.chunk_size = chunk_size
+        self.keyframe_every = keyframe_every
+
+        self._steps_file = (self.path / 'steps.bin').open('wb')
+        self._glyphs_file = (self.path / 'glyphs.bin').open('wb')
+        self._dtype = None
+        self._chunk = None
+        self._chunk_len = 0
+        self._glyph_chunks = []
+        self._glyphs_offset = 0
+        self._previous_glyphs = None
+        self._count = 0
+        self._strategies = {}
+        self.meta = {}  # additional values saved in meta.json, e.g. env seeds
+
+    def _init(self, observation):
+        self._dtype = step_dtype(observation['blstats'].shape[0], observation['message'].shape[0])
+        self._chunk = np.zeros(self.chunk_size, dtype=self._dtype)
+
+    def record(self, action, observation, strategy=None):
+        if self._dtype is None:
+            self._init(observation)
+
+        row = self._chunk[self._chunk_len]
+        row['action'] = -1 if action is None else int(action)
+        if strategy is None:
+            row['strategy'] = -1
+        else:
+            row['strategy'] = self._strategies.setdefault(strategy, len(self._strategies))
+        row['blstats'] = observation['blstats']
+        row['message'] = observation['message']
+
+        glyphs = observation['glyphs'].reshape(-1)
+        row['glyphs_offset'] = self._glyphs_offset
+        if self._previous_glyphs is None or self._count % self.keyframe_every == 0:
+            payload = glyphs.astype(np.int16)
+            row['glyphs_count'] = -1
+            self._previous_glyphs = payload.copy()
+        else:
+            changed = np.flatnonzero(glyphs != self._previous_glyphs).astype(np.int16)
+            payload = np.empty(2 * len(changed), dtype=np.int16)
+            payload[0::2] = changed
+            payload[1::2] = glyphs[changed]
+            row['glyphs_count'] = len(changed)
+            self._previous_glyphs[changed] = glyphs[changed]
+        self._glyph_chunks.append(payload)
+        self._glyphs_offset += len(payload)
+
+        self._count += 1
+        self._chunk_len += 1
+        if self._chunk_len == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self._chunk_len:
+            self._steps_file.write(self._chunk[:self._chunk_len].tobytes())
+            self._glyphs_file.write(np.concatenate(self._glyph_chunks).tobytes())
+            self._chunk_len = 0
+            self._glyph_chunks = []
+        self._steps_file.flush()
+        self._glyphs_file.flush()
+
+        with (self.path / 'meta.json').open('w') as f:
+            json.dump({
+                'blstats_size': self._dtype['blstats'].shape[0] if self._dtype is not None else BLSTATS_SIZE,
+                'message_size': self._dtype['message'].shape[0] if self._dtype is not None else MESSAGE_SIZE,
+                'glyphs_shape': [C.SIZE_Y, C.SIZE_X],
+                'steps': self._count,
+                'strategies': sorted(self._strategies, key=self._strategies.get),
+                **self.meta,
+            }, f)
+
+    def close(self):
+        self.flush()
+        self._steps_file.close()
+        self._glyphs_file.close()
+
+
+class TraceReader:
+    """ Random access to a trace written by `TraceRecorder` """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with (self.path / 'meta.json').open() as f:
+            self.meta = json.load(f)
+        self.strategies = self.meta['strategies']
+        self.glyphs_shape = tuple(self.meta['glyphs_shape'])
+        dtype = step_dtype(self.meta['blstats_size'], self.meta['message_size'])
+        self.steps = np.memmap(self.path / 'steps.bin', dtype=dtype, mode='r', shape=(self.meta['steps'],)) \
+            if self.meta['steps'] else np.zeros(0, dtype=dtype)
+        glyphs_size = (self.path / 'glyphs.bin').stat().st_size // 2
+        self._glyphs = np.memmap(self.path / 'glyphs.bin', dtype=np.int16, mode='r', shape=(glyphs_size,)) \
+            if glyphs_size else np.zeros(0, dtype=np.int16)
+
+    def __len__(self):
+        return len(self.steps)
+
+    def actions(self):
+        """ Returns the actions passed to the env, i.e. without the reset record """
+        actions = self.steps['action']
+        return actions[actions >= 0]
+
+    def glyphs(self, i):
+        """ Reconstructs the glyph map after step `i` """
+        keyframe = i
+        while self.steps[keyframe]['glyphs_count'] != -1:
+            keyframe -= 1
+
+        size = self.glyphs_shape[0] * self.glyphs_shape[1]
+        offset = self.steps[keyframe]['glyphs_offset']
+        glyphs = np.array(self._glyphs[offset: offset + size])
+        for j in range(keyframe + 1, i + 1):
+            offset, count = self.steps[j]['glyphs_offset'], self.steps[j]['glyphs_count']
+            delta = self._glyphs[offset: offset + 2 * count]
+            glyphs[delta[0::2]] = delta[1::2]
+        return glyphs.reshape(self.glyphs_shape)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        step = self.steps[i]
+        return {
+            'action': int(step['action']),
+            'strategy': self.strategies[step['strategy']] if step['strategy'] >= 0 else None,
+            'blstats': np.array(step['blstats']),
+            'message': bytes(step['message']).decode(errors='replace').replace('\0', ' ').strip(),
+            'glyphs': self.glyphs(i),
+        }
@@ -0,0 +1,41 @@
+import re
+
+import numpy as np
+
+
+class TtyScreen:
+    """ The tty screen of a single observation, converted to bytes once.
+
+    Rows are joined with b'\\n' in one buffer, so that substring and marker searches run over the whole
+    screen at once and never match across rows. Row strings are decoded only when asked for.
+    """
+
+    MARKER_REGEX = re.compile(rb"--More--|\(end\)|\(\d+ of \d+\)")
+
+    def __init__(self, tty_chars):
+        self.height, self.width = tty_chars.shape
+        buf = np.empty((self.height, self.width + 1), dtype=np.uint8)
+        buf[:, :-1] = tty_chars
+        buf[:, -1] = ord('\n')
+        buf[buf == 0] = ord(' ')
+        self.buffer = buf.tobytes()
+        self._lines = [None] * self.height
+
+    def __contains__(self, text):
+        return text in self.buffer
+
+    def line(self, i):
+        if self._lines[i] is None:
+            start = i * (self.width + 1)
+            self._lines[i] = self.buffer[start: start + self.width].decode().replace('\n', '')
+        return self._lines[i]
+
+    @property
+    def lines(self):
+        return [self.line(i) for i in range(self.height)]
+
+    def find_markers(self):
+        """ Returns list of (line, column, marker) of: --More-- | (end) | (X of N)
+        """
+        return [(*divmod(m.start(), self.width + 1), m.group().decode())
+                for m in self.MARKER_REGEX.finditer(self.buffer)]
@@ -1,4 +1,5 @@
 import functools
+import heapq
 from collections import Counter
 from functools import partial, wraps
 from itertools import chain
@@ -10,23 +11,21 @@ import numpy as np
 import seaborn as sns
 import toolz
 
+from .glyph import G
 from .strategy import Strategy
 
 
 @nb.njit(cache=True)
-def bfs(y, x, *, walkable, walkable_diagonally, can_squeeze):
-    dis = np.zeros(walkable.shape, dtype=np.int32)
-    dis[:] = -1
-    dis[y, x] = 0
-
-    buf = np.zeros((walkable.shape[0] * walkable.shape[1], 2), dtype=np.uint32)
-    index = 0
-    buf[index] = (y, x)
-    size = 1
+def _bfs_expand(dis, buf, index, size, walkable, walkable_diagonally, can_squeeze, parent, targets):
+    # `parent` and `targets` are optional -- pass empty arrays to disable them
+    stop_dis = -1
     while index < size:
         y, x = buf[index]
         index += 1
 
+        if stop_dis != -1 and dis[y, x] >= stop_dis:
+            break
+
         for dy in [-1, 0, 1]:
             for dx in [-1, 0, 1]:
                 py, px = y + dy, x + dx
@@ -39,10 +38,202 @@ def bfs(y, x, *, walkable, walkable_diagonally, can_squeeze):
                             dis[py, px] = dis[y, x] + 1
                             buf[size] = (py, px)
                             size += 1
+                            if parent.size:
+                                parent[py, px] = y * walkable.shape[1] + x
+                            if targets.size and targets[py, px] and stop_dis == -1:
+                                stop_dis = dis[py, px]
+    return size
+
+
+@nb.njit(cache=True)
+def bfs(y, x, *, walkable, walkable_diagonally, can_squeeze):
+    dis = np.zeros(walkable.shape, dtype=np.int32)
+    dis[:] = -1
+    dis[y, x] = 0
+
+    buf = np.zeros((walkable.shape[0] * walkable.shape[1], 2), dtype=np.uint32)
+    buf[0] = (y, x)
+    _bfs_expand(dis, buf, 0, 1, walkable, walkable_diagonally, can_squeeze,
+                np.zeros((0, 0), dtype=np.int32), np.zeros((0, 0), dtype=np.bool_))
 
     return dis
 
 
+@nb.njit(cache=True)
+def bfs_with_parents(y, x, *, walkable, walkable_diagonally, can_squeeze):
+    """ The same as `bfs`, but also returns the predecessor map (see `bfs_nearest`) """
+    dis = np.zeros(walkable.shape, dtype=np.int32)
+    dis[:] = -1
+    dis[y, x] = 0
+    parent = np.zeros(walkable.shape, dtype=np.int32)
+    parent[:] = -1
+
+    buf = np.zeros((walkable.shape[0] * walkable.shape[1], 2), dtype=np.uint32)
+    buf[0] = (y, x)
+    _bfs_expand(dis, buf, 0, 1, walkable, walkable_diagonally, can_squeeze,
+                parent, np.zeros((0, 0), dtype=np.bool_))
+
+    return dis, parent
+
+
+@nb.njit(cache=True)
+def bfs_nearest(y, x, targets, *, walkable, walkable_diagonally, can_squeeze):
+    """ BFS from (y, x) that stops as soon as the layer of the nearest tile from `targets` mask is complete.
+
+    Returns (dis, parent). `dis` is -1 for tiles that weren't reached before stopping, so all targets with
+    `dis != -1` are the nearest ones. `parent` contains the flattened index (y * width + x) of the predecessor
+    on a shortest path (-1 for the source and not reached tiles).
+    """
+    dis = np.zeros(walkable.shape, dtype=np.int32)
+    dis[:] = -1
+    dis[y, x] = 0
+    parent = np.zeros(walkable.shape, dtype=np.int32)
+    parent[:] = -1
+
+    if targets[y, x]:
+        return dis, parent
+
+    buf = np.zeros((walkable.shape[0] * walkable.shape[1], 2), dtype=np.uint32)
+    buf[0] = (y, x)
+    _bfs_expand(dis, buf, 0, 1, walkable, walkable_diagonally, can_squeeze, parent, targets)
+
+    return dis, parent
+
+
+@nb.njit(cache=True)
+def dijkstra(y, x, cost, *, walkable, walkable_diagonally, can_squeeze):
+    """ Weighted version of `bfs`. Entering a tile costs 1 + cost[tile] (`cost` must be non-negative).
+
+    Returns (dis, parent) like `bfs_with_parents`, but `dis` is a float array (-1 for unreachable tiles).
+    """
+    dis = np.zeros(walkable.shape, dtype=np.float64)
+    dis[:] = -1
+    dis[y, x] = 0
+    parent = np.zeros(walkable.shape, dtype=np.int32)
+    parent[:] = -1
+    done = np.zeros(walkable.shape, dtype=np.bool_)
+
+    heap = [(0.0, y * walkable.shape[1] + x)]
+    while heap:
+        d, i = heapq.heappop(heap)
+        y, x = i // walkable.shape[1], i % walkable.shape[1]
+        if done[y, x]:
+            continue
+        done[y, x] = True
+
+        for dy in [-1, 0, 1]:
+            for dx in [-1, 0, 1]:
+                py, px = y + dy, x + dx
+                if 0 <= py < walkable.shape[0] and 0 <= px < walkable.shape[1] and (dy != 0 or dx != 0):
+                    if (walkable[py, px] and not done[py, px] and
+                            (abs(dy) + abs(dx) <= 1 or
+                             (walkable_diagonally[py, px] and walkable_diagonally[y, x] and
+                              (can_squeeze or walkable[py, x] or walkable[y, px])))):
+                        new_d = d + 1 + cost[py, px]
+                        if dis[py, px] == -1 or new_d < dis[py, px]:
+                            dis[py, px] = new_d
+                            parent[py, px] = i
+                            heapq.heappush(heap, (new_d, py * walkable.shape[1] + px))
+
+    return dis, parent
+
+
+@nb.njit(cache=True)
+def path_from_parents(parent, to_y, to_x):
+    """ Returns (n, 2) array with the path from the BFS source to (to_y, to_x) read from the predecessor map """
+    length = 1
+    p = parent[to_y, to_x]
+    while p != -1:
+        length += 1
+        p = parent[p // parent.shape[1], p % parent.shape[1]]
+
+    ret = np.zeros((length, 2), dtype=np.int32)
+    y, x = to_y, to_x
+    for i in range(length - 1, -1, -1):
+        ret[i] = (y, x)
+        p = parent[y, x]
+        y, x = p // parent.shape[1], p % parent.shape[1]
+    return ret
+
+
+@nb.njit(cache=True)
+def path_from_dis(dis, to_y, to_x, seed):
+    """ Returns (n, 2) array with a shortest path from the BFS source to (to_y, to_x) read from the distance map.
+
+    If `seed` is non-negative, ties between neighbors are broken uniformly at random,
+    otherwise the first neighbor in the fixed order is taken.
+    """
+    if seed >= 0:
+        np.random.seed(seed)
+
+    length = dis[to_y, to_x] + 1
+    ret = np.zeros((length, 2), dtype=np.int32)
+    candidates = np.zeros((8, 2), dtype=np.int32)
+    y, x = to_y, to_x
+    for i in range(length - 1, 0, -1):
+        ret[i] = (y, x)
+        count = 0
+        for dy in [-1, 0, 1]:
+            for dx in [-1, 0, 1]:
+                py, px = y + dy, x + dx
+                if 0 <= py < dis.shape[0] and 0 <= px < dis.shape[1] and (dy != 0 or dx != 0):
+                    if dis[py, px] == dis[y, x] - 1:
+                        candidates[count] = (py, px)
+                        count += 1
+        assert count > 0
+        j = np.random.randint(count) if seed >= 0 else 0
+        y, x = candidates[j]
+    ret[0] = (y, x)
+    return ret
+
+
+@nb.njit(cache=True)
+def bfs_repair(dis, *, old_walkable, old_walkable_diagonally, walkable, walkable_diagonally, can_squeeze,
+               max_changed):
+    """ Update the result of `bfs` (from the same source) after the walkability masks changed.
+
+    Every edge affected by a changed tile has both ends in the 3x3 neighbourhood of that tile, so distances
+    not greater than the smallest reachable distance in those neighbourhoods stay valid. Only the tiles above
+    that layer are reset and expanded again from it.
+
+    With more than `max_changed` changed tiles the repair is unlikely to keep much, so everything but
+    the source is recomputed (i.e. a full BFS).
+    """
+    min_dis = -1
+    changed = 0
+    for cy in range(walkable.shape[0]):
+        for cx in range(walkable.shape[1]):
+            if walkable[cy, cx] == old_walkable[cy, cx] and \
+                    walkable_diagonally[cy, cx] == old_walkable_diagonally[cy, cx]:
+                continue
+            changed += 1
+            for ny in range(max(0, cy - 1), min(walkable.shape[0], cy + 2)):
+                for nx in range(max(0, cx - 1), min(walkable.shape[1], cx + 2)):
+                    d = dis[ny, nx]
+                    if d != -1 and (min_dis == -1 or d < min_dis):
+                        min_dis = d
+
+    ret = dis.copy()
+    if changed > max_changed:
+        min_dis = 0
+    if min_dis == -1:
+        return ret
+
+    buf = np.zeros((walkable.shape[0] * walkable.shape[1], 2), dtype=np.uint32)
+    size = 0
+    for cy in range(walkable.shape[0]):
+        for cx in range(walkable.shape[1]):
+            if ret[cy, cx] == min_dis:
+                buf[size] = (cy, cx)
+                size += 1
+            elif ret[cy, cx] > min_dis:
+                ret[cy, cx] = -1
+    _bfs_expand(ret, buf, 0, size, walkable, walkable_diagonally, can_squeeze,
+                np.zeros((0, 0), dtype=np.int32), np.zeros((0, 0), dtype=np.bool_))
+
+    return ret
+
+
 def translate(array, y_offset, x_offset, out=None):
     if out is None:
         out = np.zeros_like(array)
@@ -111,6 +302,30 @@ def isin(array, *elems):
     return _isin_kernel(array, mi, ma, mask)
 
 
+@nb.njit('u8[:,:](i2[:,:],u8[:])', cache=True)
+def _glyph_classes_kernel(array, table):
+    ret = np.zeros(array.shape, dtype=nb.u8)
+    for y in range(array.shape[0]):
+        for x in range(array.shape[1]):
+            if 0 <= array[y, x] < table.shape[0]:
+                ret[y, x] = table[array[y, x]]
+    return ret
+
+
+def glyph_classes(array):
+    """ Returns for each cell a bitset of the `G` sets its glyph belongs to (see `class_mask`) """
+    assert array.dtype == np.int16
+    return _glyph_classes_kernel(array, G.BIT_TABLE)
+
+
+def class_mask(classes, *elems):
+    """ Same as `isin(array, *elems)` for `classes = glyph_classes(array)`, but elems must be `G` sets """
+    bits = 0
+    for e in elems:
+        bits |= G.BITS[e]
+    return (classes & np.uint64(bits)) != 0
+
+
 def any_in(array, *elems):
     # TODO: optimize
     return isin(array, *elems).any()
@@ -126,13 +341,13 @@ def debug_log(txt, fun, color=(255, 255, 255)):
         else:
             env = self.env
 
-        with env.debug_log(txt=txt, color=color):
+        with env.debug_log(txt=txt, color=color, is_strategy=True):
             ret = fun(self, *args, **kwargs)
             if isinstance(ret, Strategy):
                 def f(strategy=ret.strategy, *a, **k):
                     it = strategy(*a, **k)
                     yield next(it)
-                    with env.debug_log(txt=txt, color=color):
+                    with env.debug_log(txt=txt, color=color, is_strategy=True):
                         try:
                             next(it)
                             assert 0
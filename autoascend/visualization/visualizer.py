@@ -316,7 +316,7 @@ class Visualizer:
         i += 2
 
         stats = list(self.env.agent.stats_logger.get_stats_dict().items())
-        stats = [(k, v) for k, v in stats if v != 0]
+        stats = [(k, v) for k, v in stats if v != 0 and not isinstance(v, dict)]
         for j in range((len(stats) + 2) // 3):
             def format_value(v):
                 if isinstance(v, float):
@@ -0,0 +1,228 @@
+import json
+import sys
+import time
+import traceback
+from argparse import ArgumentParser
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+
+import gym
+
+from autoascend import agent as agent_lib
+from autoascend import utils
+from autoascend.env_wrapper import EnvWrapper
+from autoascend.item.inventory_items import InventoryItems
+from autoascend.item.item_manager import ItemManager
+from autoascend.observation_features import ObservationFeatures
+
+DEFAULT_SEEDS = (1, 2, 3, 4, 5, 6, 7, 8)
+DEFAULT_STEPS = 5000
+WARMUP_STEPS = 300
+
+# subsystem -> (owner, attribute) pairs measured by `SubsystemTimers`
+SUBSYSTEMS = {
+    'bfs': [(utils, 'bfs'), (utils, 'bfs_with_parents'), (utils, 'bfs_nearest'), (utils, 'bfs_repair'),
+            (utils, 'dijkstra')],
+    'isin': [(utils, 'isin'), (utils, 'any_in'), (utils, 'glyph_classes'), (utils, 'class_mask'),
+             (ObservationFeatures, 'mask')],
+    'message_parsing': [(agent_lib.Agent, 'get_message_and_popup')],
+    'inventory_parsing': [(InventoryItems, 'update'), (ItemManager, 'get_item_from_text')],
+}
+
+
+class SubsystemTimers:
+    """
+    Cumulative wall time of the functions in `SUBSYSTEMS`. Only the outermost call of a subsystem is measured,
+    but subsystems may nest in each other (e.g. `isin` called during inventory parsing counts for both).
+    """
+
+    def __init__(self):
+        self.times = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.function_calls = defaultdict(int)  # e.g. how often `bfs_repair` replaces a full `bfs`
+        self._depth = defaultdict(int)
+
+    def wrap(self, name, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            self.calls[name] += 1
+            self.function_calls[func.__qualname__] += 1
+            if self._depth[name]:
+                return func(*args, **kwargs)
+            self._depth[name] += 1
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.times[name] += time.perf_counter() - start
+                self._depth[name] -= 1
+
+        return wrapper
+
+    @contextmanager
+    def install(self):
+        originals = []
+        for name, targets in SUBSYSTEMS.items():
+            for owner, attr in targets:
+                func = owner.__dict__[attr]
+                originals.append((owner, attr, func))
+                setattr(owner, attr, self.wrap(name, func))
+        try:
+            yield self
+        finally:
+            for owner, attr, func in originals:
+                setattr(owner, attr, func)
+
+
+def make_env(seed, steps, profile_strategies=False):
+    env = EnvWrapper(gym.make('NetHackChallenge-v0', no_progress_timeout=1000),
+                     step_limit=steps, agent_args=dict(profile_strategies=profile_strategies))
+    env.env.seed(seed, seed)
+    return env
+
+
+def warm_up(seed):
+    """ Plays a few steps so that numba kernels are compiled (or loaded from the cache) outside of measurements """
+    env = make_env(seed, WARMUP_STEPS)
+    try:
+        env.main()
+    except Exception:
+        pass  # errors are reported by the measured run
+    env.env.close()
+
+
+def strategy_condition_time(seed, steps):
+    """ Strategy condition time of a separate run with strategy profiling, which slows down the agent """
+    env = make_env(seed, steps, profile_strategies=True)
+    try:
+        env.main()
+    except Exception:
+        pass  # errors are reported by the measured run
+    strategy_stats = env.agent.stats_logger.get_stats_dict().get('strategy_stats', {}) if env.agent is not None else {}
+    env.env.close()
+    return sum(s['condition_time'] for s in strategy_stats.values())
+
+
+def run_seed(seed, steps, strategy_times=True):
+    env = make_env(seed, steps)
+
+    timers = SubsystemTimers()
+    env.env.step = timers.wrap('env_step', env.env.step)
+    error = None
+    start_time = time.perf_counter()
+    with timers.install():
+        try:
+            env.main()
+        except BaseException as e:
+            error = ''.join(traceback.format_exception(None, e, e.__traceback__))
+    duration = time.perf_counter() - start_time
+    env.env.close()
+
+    subsystems = dict(timers.times)
+    if strategy_times:
+        subsystems['strategy_conditions'] = strategy_condition_time(seed, steps)
+    result = {
+        'seed': seed,
+        'steps': env.step_count,
+        'turns': int(env.last_observation['blstats'][20]),
+        'score': env.score,
+        'duration': duration,
+        'steps_per_second': env.step_count / duration,
+        'subsystems': subsystems,
+        'calls': dict(timers.calls),
+        'function_calls': dict(timers.function_calls),
+        'error': error,
+    }
+    return result
+
+
+def summarize(results):
+    duration = sum(r['duration'] for r in results)
+    steps = sum(r['steps'] for r in results)
+    subsystems = defaultdict(float)
+    for r in results:
+        for name, t in r['subsystems'].items():
+            subsystems[name] += t
+    return {
+        'steps': steps,
+        'turns': sum(r['turns'] for r in results),
+        'duration': duration,
+        'steps_per_second': steps / duration,
+        # microseconds per env step, comparable between runs that didn't take exactly the same steps
+        'subsystems_us_per_step': {name: t / steps * 1e6 for name, t in subsystems.items()},
+        'errors': sum(r['error'] is not None for r in results),
+    }
+
+
+def compare(summary, baseline, tolerance):
+    """ Prints the comparison with the baseline summary. Returns False on a regression above `tolerance` """
+    ok = True
+    ratio = summary['steps_per_second'] / baseline['steps_per_second']
+    print(f'steps_per_second: {summary["steps_per_second"]:.1f} (baseline {baseline["steps_per_second"]:.1f}, '
+          f'{(ratio - 1) * 100:+.1f}%)')
+    if ratio < 1 - tolerance:
+        print('  REGRESSION')
+        ok = False
+
+    for name, value in sorted(summary['subsystems_us_per_step'].items()):
+        base_value = baseline['subsystems_us_per_step'].get(name)
+        if not base_value:
+            print(f'{name:20}: {value:8.1f} us/step (no baseline)')
+            continue
+        ratio = value / base_value
+        print(f'{name:20}: {value:8.1f} us/step (baseline {base_value:8.1f}, {(ratio - 1) * 100:+.1f}%)'
+              + ('  REGRESSION' if ratio > 1 + tolerance else ''))
+        if ratio > 1 + tolerance:
+            ok = False
+
+    if summary['steps'] != baseline['steps']:
+        print(f'WARNING: the agent took {summary["steps"]} steps, the baseline {baseline["steps"]} '
+              '-- its behavior changed, so the comparison is approximate')
+    return ok
+
+
+def parse_args():
+    parser = ArgumentParser(description='Agent throughput benchmark on a fixed seed set and step budget')
+    parser.add_argument('--seeds', type=int, nargs='*', default=list(DEFAULT_SEEDS))
+    parser.add_argument('--steps', type=int, default=DEFAULT_STEPS, help='Step budget per seed')
+    parser.add_argument('--output', type=Path, default=Path('benchmark.json'))
+    parser.add_argument('--baseline', type=Path, default=None,
+                        help='Benchmark output to compare with. Exits with status 1 on a regression')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Allowed relative slowdown of steps per second and of each subsystem')
+    parser.add_argument('--no-strategy-times', action='store_true',
+                        help="Skip the extra profiled run per seed that measures strategy conditions "
+                             "(it's never included in steps per second)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    warm_up(args.seeds[0])
+    results = []
+    for seed in args.seeds:
+        result = run_seed(seed, args.steps, strategy_times=not args.no_strategy_times)
+        print(f'seed {seed}: {result["steps"]} steps, {result["steps_per_second"]:.1f} steps/s'
+              + (' (error)' if result['error'] else ''))
+        results.append(result)
+
+    summary = summarize(results)
+    with args.output.open('w') as f:
+        json.dump({'seeds': args.seeds, 'step_budget': args.steps, 'summary': summary, 'results': results},
+                  f, indent=2)
+    print(json.dumps(summary, indent=2))
+
+    if args.baseline is not None:
+        with args.baseline.open() as f:
+            baseline = json.load(f)
+        if baseline['seeds'] != args.seeds or baseline['step_budget'] != args.steps:
+            print('WARNING: the baseline was run with different seeds or step budget')
+        if not compare(summary, baseline['summary'], args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+import json
+import time
+from argparse import ArgumentParser
+from itertools import chain
+from pathlib import Path
+
+import numpy as np
+
+# kernels with explicit signatures are compiled (or loaded from the numba cache) on import
+_import_start = time.perf_counter()
+from autoascend import utils
+from autoascend.glyph import C, G, SS
+from autoascend.glyph import monster as MON
+from autoascend.monster_tracker.kernels import disappearance_mask, figure_out_monster_movement
+from autoascend.soko_solver import maps as soko_maps
+IMPORT_TIME = time.perf_counter() - _import_start
+
+BOULDER = min(G.BOULDER)
+SOKO_SYMBOLS = {'.': SS.S_room, '<': SS.S_upstair, '>': SS.S_dnstair, '?': SS.S_room, '+': SS.S_vcdoor,
+                '^': SS.S_hole, '0': BOULDER, '-': SS.S_hwall, '|': SS.S_vwall, ' ': SS.S_stone}
+
+
+def rooms_and_corridors(rng, num_rooms=8):
+    """ Regular dungeon level: rectangular rooms connected with corridors """
+    glyphs = np.full((C.SIZE_Y, C.SIZE_X), SS.S_stone, dtype=np.int16)
+    centers = []
+    for _ in range(num_rooms * 10):
+        h, w = rng.randint(3, 7), rng.randint(4, 14)
+        y, x = rng.randint(1, C.SIZE_Y - h - 2), rng.randint(1, C.SIZE_X - w - 2)
+        if (glyphs[y - 1: y + h + 3, x - 1: x + w + 3] != SS.S_stone).any():
+            continue
+        glyphs[y: y + h + 2, x] = glyphs[y: y + h + 2, x + w + 1] = SS.S_vwall
+        glyphs[y, x: x + w + 2] = glyphs[y + h + 1, x: x + w + 2] = SS.S_hwall
+        glyphs[y + 1: y + h + 1, x + 1: x + w + 1] = SS.S_room
+        centers.append((y + 1 + h // 2, x + 1 + w // 2))
+        if len(centers) == num_rooms:
+            break
+
+    for (y1, x1), (y2, x2) in zip(centers, centers[1:]):
+        path = [(y1, x) for x in range(min(x1, x2), max(x1, x2) + 1)] + \
+               [(y, x2) for y in range(min(y1, y2), max(y1, y2) + 1)]
+        for y, x in path:
+            if glyphs[y, x] == SS.S_stone:
+                glyphs[y, x] = SS.S_corr
+            elif glyphs[y, x] in (SS.S_vwall, SS.S_hwall):
+                glyphs[y, x] = SS.S_ndoor
+    return glyphs
+
+
+def mines_cavern(rng, fill=0.55, iterations=4):
+    """ Open Gnomish Mines like level: a smoothed random cave surrounded by walls """
+    floor = rng.random_sample((C.SIZE_Y, C.SIZE_X)) < fill
+    for _ in range(iterations):
+        neighbors = sum(np.roll(np.roll(floor, dy, 0), dx, 1)
+                        for dy in (-1, 0, 1) for dx in (-1, 0, 1) if dy or dx)
+        floor = np.where(floor, neighbors >= 4, neighbors >= 5)
+    floor[[0, -1]] = floor[:, [0, -1]] = False
+
+    glyphs = np.full((C.SIZE_Y, C.SIZE_X), SS.S_stone, dtype=np.int16)
+    glyphs[utils.dilate(floor) & ~floor] = SS.S_vwall
+    glyphs[floor] = SS.S_room
+    return glyphs
+
+
+def sokoban(text):
+    glyphs = np.full((C.SIZE_Y, C.SIZE_X), SS.S_stone, dtype=np.int16)
+    lines = [line for line in text.splitlines() if line]
+    for y, line in enumerate(lines):
+        for x, char in enumerate(line):
+            glyphs[y + 2, x + 2] = SOKO_SYMBOLS[char]
+    return glyphs
+
+
+def generate_maps(num_maps, seed):
+    rng = np.random.RandomState(seed)
+    return {
+        'rooms': [rooms_and_corridors(rng) for _ in range(num_maps)],
+        'mines': [mines_cavern(rng) for _ in range(num_maps)],
+        'sokoban': [sokoban(text) for text in soko_maps],
+    }
+
+
+def place_monsters(rng, glyphs, walkable, count):
+    """ Returns (old, new) monster maps: `count` monsters on walkable tiles, moved by at most one tile """
+    old = np.full(glyphs.shape, -1, dtype=np.int16)
+    new = np.full(glyphs.shape, -1, dtype=np.int16)
+    ys, xs = walkable.nonzero()
+    for i in rng.choice(len(ys), size=min(count, len(ys)), replace=False):
+        glyph = MON.ALL_MONS[rng.randint(len(MON.ALL_MONS))]
+        old[ys[i], xs[i]] = glyph
+        y = np.clip(ys[i] + rng.randint(-1, 2), 0, glyphs.shape[0] - 1)
+        x = np.clip(xs[i] + rng.randint(-1, 2), 0, glyphs.shape[1] - 1)
+        new[y, x] = glyph
+    return old, new
+
+
+def kernel_calls(glyphs, rng, num_monsters):
+    """ Returns name -> (function without arguments, number of processed cells) """
+    walkable = utils.isin(glyphs, G.FLOOR, G.DOORS, G.STAIR_UP, G.STAIR_DOWN)
+    walkable_diagonally = walkable & ~utils.isin(glyphs, G.DOORS)
+    ys, xs = walkable.nonzero()
+    start = rng.randint(len(ys))
+    y, x = ys[start], xs[start]
+
+    # `bfs_repair` after one tile (e.g. a monster) changed far from the source and next to it
+    dis = utils.bfs(y, x, walkable=walkable, walkable_diagonally=walkable_diagonally, can_squeeze=False)
+    far = np.unravel_index(np.argmax(dis), dis.shape)
+    near = min(zip(*((dis == 1).nonzero())), default=far)
+    repairs = {}
+    for name, (ty, tx) in [('far', far), ('near', near)]:
+        changed = walkable.copy()
+        changed[ty, tx] = False
+        repairs[name] = (changed, changed & walkable_diagonally)
+
+    old_mons, new_mons = place_monsters(rng, glyphs, walkable, num_monsters)
+    peaceful = old_mons.copy()
+    aggressive = old_mons.copy()
+    is_peaceful = rng.random_sample(glyphs.shape) < 0.5
+    peaceful[~is_peaceful] = -1
+    aggressive[is_peaceful] = -1
+
+    small_elems = (G.WALL, G.DOORS)
+    large_elems = (G.MONS, G.INVISIBLE_MON)
+    small_mask = utils._isin_mask(small_elems)
+    large_mask = utils._isin_mask(large_elems)
+    large_elems_array = np.array(list(chain(*large_elems)), np.int16)
+
+    cells = glyphs.size
+    return {
+        'bfs': (lambda: utils.bfs(y, x, walkable=walkable, walkable_diagonally=walkable_diagonally,
+                                  can_squeeze=False), cells),
+        **{f'bfs_repair(1 {name} tile)': (
+            lambda masks=masks: utils.bfs_repair(dis, old_walkable=walkable,
+                                                 old_walkable_diagonally=walkable_diagonally,
+                                                 walkable=masks[0], walkable_diagonally=masks[1],
+                                                 can_squeeze=False, max_changed=32), cells)
+           for name, masks in repairs.items()},
+        '_isin_kernel(walls)': (lambda: utils._isin_kernel(glyphs, *small_mask), cells),
+        '_isin_kernel(monsters)': (lambda: utils._isin_kernel(glyphs, *large_mask), cells),
+        '_isin_mask_kernel(monsters)': (lambda: utils._isin_mask_kernel(large_elems_array), len(large_elems_array)),
+        'disappearance_mask': (lambda: disappearance_mask(old_mons, new_mons, 1), cells),
+        'figure_out_monster_movement': (lambda: figure_out_monster_movement(peaceful, aggressive, new_mons, 2),
+                                        cells),
+    }
+
+
+def measure(func, number, repeat):
+    """ Best time of a single call (in seconds) from `repeat` batches of `number` calls """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def parse_args():
+    parser = ArgumentParser(description='Microbenchmark of the numba kernels on synthetic 21x79 levels')
+    parser.add_argument('--maps', type=int, default=8, help='Number of generated maps per family '
+                                                            '(Sokoban uses all its maps)')
+    parser.add_argument('--monsters', type=int, default=15, help='Number of monsters per map')
+    parser.add_argument('--number', type=int, default=200, help='Calls per timing batch')
+    parser.add_argument('--repeat', type=int, default=5, help='Timing batches (the best is taken)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=Path, default=None, help='Optional json output')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    rng = np.random.RandomState(args.seed)
+    maps = generate_maps(args.maps, args.seed)
+
+    # first calls compile the lazily compiled kernels (e.g. `bfs`) or load them from the numba cache
+    first_call = {}
+    for name, (func, _) in kernel_calls(maps['rooms'][0], rng, args.monsters).items():
+        start = time.perf_counter()
+        func()
+        first_call[name] = time.perf_counter() - start
+
+    results = {}
+    for family, family_maps in maps.items():
+        per_map = {}
+        for glyphs in family_maps:
+            for name, (func, cells) in kernel_calls(glyphs, rng, args.monsters).items():
+                per_map.setdefault(name, []).append((measure(func, args.number, args.repeat), cells))
+        results[family] = {name: {'ns_per_call': float(np.median([t for t, _ in values]) * 1e9),
+                                  'ns_per_cell': float(np.median([t / cells for t, cells in values]) * 1e9)}
+                           for name, values in per_map.items()}
+
+    print(f'import with eagerly compiled kernels: {IMPORT_TIME * 1e3:.1f} ms')
+    print(f'{"kernel":30} {"first call [ms]":>16}', *(f'{family + " [ns/cell]":>20}' for family in maps))
+    for name in first_call:
+        print(f'{name:30} {first_call[name] * 1e3:16.1f}',
+              *(f'{results[family][name]["ns_per_cell"]:20.2f}' for family in maps))
+
+    if args.output is not None:
+        with args.output.open('w') as f:
+            json.dump({'import_seconds': IMPORT_TIME, 'first_call_seconds': first_call, 'results': results, 'args': vars(args)}, f, indent=2,
+                      default=str)
+
+
+if __name__ == '__main__':
+    main()
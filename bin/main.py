@@ -1,5 +1,6 @@
 import json
 import multiprocessing
+import multiprocessing.connection
 import os
 import subprocess
 import sys
@@ -8,6 +9,7 @@ import time
 import traceback
 import tty
 import warnings
+from abc import ABC, abstractmethod
 from argparse import ArgumentParser
 from multiprocessing import Process, Queue
 from multiprocessing.pool import ThreadPool
@@ -20,13 +22,19 @@ import numpy as np
 
 from autoascend import agent as agent_lib
 from autoascend.env_wrapper import EnvWrapper
+from autoascend.online_stats import Reservoir, SimulationStats
+from autoascend.results_store import ResultsStore, writable_store
+from autoascend.trace import TraceReader
 from autoascend.utils import plot_dashboard
 
+PLOT_SAMPLE_SIZE = 2000  # episodes drawn on the dashboard of simulate mode
 
-def prepare_env(args, seed):
+
+def prepare_env(args, seed, seeds=None):
     seed += args.seed
+    interactive = args.mode == 'run' or (args.mode == 'replay' and args.play_after_replay)
 
-    if args.role:
+    if args.role and seeds is None:
         while 1:
             env = gym.make('NetHackChallenge-v0')
             env.seed(seed, seed)
@@ -43,9 +51,9 @@ def prepare_env(args, seed):
         args.skip_to = 2 ** 32
 
     visualize_with_simulate = args.visualize_ends is not None or args.output_video_dir is not None
-    visualizer_args = dict(enable=args.mode == 'run' or visualize_with_simulate,
+    visualizer_args = dict(enable=interactive or visualize_with_simulate,
                            start_visualize=args.visualize_ends[seed] if args.visualize_ends is not None else None,
-                           show=args.mode == 'run',
+                           show=interactive,
                            output_dir=Path('/tmp/vis/') / str(seed),
                            frame_skipping=None if not visualize_with_simulate else 1,
                            output_video_path=(args.output_video_dir / f'{seed}.mp4'
@@ -53,24 +61,71 @@ def prepare_env(args, seed):
     env = EnvWrapper(gym.make('NetHackChallenge-v0', no_progress_timeout=1000),
                      to_skip=args.skip_to, visualizer_args=visualizer_args,
                      agent_args=dict(panic_on_errors=args.panic_on_errors,
-                                     verbose=args.mode == 'run'),
-                     interactive=args.mode == 'run')
-    env.env.seed(seed, seed)
+                                     verbose=interactive,
+                                     profile_strategies=args.profile_strategies),
+                     interactive=interactive,
+                     trace_dir=args.trace_dir / str(seed) if args.trace_dir is not None else None)
+    if seeds is not None:
+        env.env.seed(*seeds)
+    else:
+        env.env.seed(seed, seed)
     return env
 
 
+def run_with_watchdog(env, timeout, window, min_turns_per_second):
+    """
+    Runs `env.main` until it ends, `timeout` seconds pass, or the game advanced less than
+    `min_turns_per_second * window` turns in the last `window` seconds (i.e. the agent is stuck).
+    Returns the end reason for the two latter cases.
+
+    The progress is watched only from the first advanced turn, so that the startup (e.g. compiling
+    numba kernels in a fresh worker) doesn't count. Turn-free computation later in the game (e.g. the
+    Sokoban solver) has to fit in `window`, so the window shouldn't be too short.
+    """
+    def current_turn():
+        obs = env.last_observation
+        return int(obs['blstats'][20]) if obs is not None else None
+
+    start_time = time.time()
+    with ThreadPool(1) as pool:
+        result = pool.apply_async(env.main)
+        window_start = window_turn = None
+        while 1:
+            wait = start_time + timeout - time.time()
+            if window_start is None:
+                wait = min(wait, 1)
+            else:
+                wait = min(wait, window_start + window - time.time())
+            try:
+                result.get(max(0, wait))
+                return None
+            except multiprocessing.context.TimeoutError:
+                pass
+
+            now = time.time()
+            if now >= start_time + timeout:
+                return 'timeout'
+            turn = current_turn()
+            if window_start is None:
+                if turn is not None and turn > 1:  # games start at turn 1
+                    window_start, window_turn = now, turn
+            elif now - window_start >= window:
+                if (turn - window_turn) / (now - window_start) < min_turns_per_second:
+                    return f'timeout: less than {min_turns_per_second} turns per second for {window} seconds'
+                window_start, window_turn = now, turn
+
+
 def single_simulation(args, seed_offset, timeout=720):
     start_time = time.time()
     env = prepare_env(args, seed_offset)
 
     try:
         if timeout is not None:
-            with ThreadPool(1) as pool:
-                pool.apply_async(env.main).get(timeout)
+            end_reason = run_with_watchdog(env, timeout, args.watchdog_window, args.watchdog_min_turns_per_second)
+            if end_reason is not None:
+                env.end_reason = end_reason
         else:
             env.main()
-    except multiprocessing.context.TimeoutError:
-        env.end_reason = f'timeout'
     except BaseException as e:
         env.end_reason = f'exception: {"".join(traceback.format_exception(None, e, e.__traceback__))}'
         print(f'Seed {env.env.get_seeds()}, step {env.step_count}:', env.end_reason)
@@ -84,11 +139,45 @@ def single_simulation(args, seed_offset, timeout=720):
 
     if env.visualizer is not None and env.visualizer.video_writer is not None:
         env.visualizer.video_writer.close()
+    if env.recorder is not None:
+        env.recorder.close()
     env.env.close()
 
     return summary
 
 
+def get_rss():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+class EpisodeWorker:
+    """
+    Runs episodes one after another in a warm interpreter (imported agent, loaded numba caches).
+    Only the env is recreated -- `gym.make` creates a fresh vardir, so bones of previous episodes don't leak in.
+
+    `run` also tells whether the worker should be recycled: after `--worker-max-episodes` episodes,
+    when RSS grew more than `--worker-max-rss-growth` MiB since the first episode, or after a timeout
+    (the timed out episode thread can't be stopped).
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.episodes = 0
+        self.base_rss = None
+
+    def run(self, seed_offset, timeout):
+        summary = single_simulation(self.args, seed_offset, timeout=timeout)
+        self.episodes += 1
+        rss = get_rss()
+        if self.base_rss is None:
+            self.base_rss = rss
+        recycle = summary['end_reason'].startswith('timeout') or \
+                  self.episodes >= self.args.worker_max_episodes or \
+                  rss - self.base_rss > self.args.worker_max_rss_growth * 2 ** 20
+        return summary, recycle
+
+
 def run_single_interactive_game(args):
     termios.tcgetattr(sys.stdin)
     tty.setcbreak(sys.stdin.fileno())
@@ -99,6 +188,31 @@ def run_single_interactive_game(args):
         os.system('stty sane')
 
 
+def run_replay(args):
+    trace = TraceReader(args.trace)
+    actions = trace.actions()
+    if args.replay_steps is not None:
+        actions = actions[:args.replay_steps]
+
+    env = prepare_env(args, 0, seeds=trace.meta['seeds'])
+    if args.play_after_replay:
+        termios.tcgetattr(sys.stdin)
+        tty.setcbreak(sys.stdin.fileno())
+    try:
+        start_time = time.time()
+        env.main(replay_actions=actions, play=False)
+        print(f'Replayed {env.step_count} actions in {time.time() - start_time:.2f}s')
+        if args.play_after_replay and not env.is_done:
+            env.play()
+            pprint(env.get_summary())
+        else:
+            print('\n'.join(bytes(line).decode(errors='replace') for line in env.last_observation['tty_chars']))
+    finally:
+        if args.play_after_replay:
+            os.system('stty sane')
+        env.env.close()
+
+
 def run_profiling(args):
     if args.profiler == 'cProfile':
         import cProfile, pstats
@@ -202,9 +316,254 @@ def run_profiling(args):
         assert 0
 
 
+class Executor(ABC):
+    """ Runs simulations of the given seed offsets and yields their summaries in the order of completion """
+
+    def __init__(self, args):
+        self.args = args
+        self.timeout = args.max_episode_time if args.output_video_dir is None else 4 * 24 * 60 * 60
+        self._retried = set()
+
+    @abstractmethod
+    def results(self, seed_offsets):
+        pass
+
+    def close(self):
+        pass
+
+    def _retry(self, seed_offset, pending):
+        """ Called when a worker died during an episode -- the seed is run once again in a new one """
+        if seed_offset in self._retried:
+            print(f'Worker died twice on seed offset {seed_offset}, skipping it')
+            return
+        self._retried.add(seed_offset)
+        pending.insert(0, seed_offset)
+
+
+class RayExecutor(Executor):
+    """ Runs simulations on a Ray cluster -- a new process per episode, or `EpisodeWorker` actors with --warm-workers """
+
+    def __init__(self, args):
+        super().__init__(args)
+        import ray
+        self.ray = ray
+        ray.init(address='auto')
+
+    def results(self, seed_offsets):
+        if self.args.warm_workers:
+            return self._warm_worker_results(seed_offsets)
+        return self._process_per_episode_results(seed_offsets)
+
+    def _process_per_episode_results(self, seed_offsets):
+        ray = self.ray
+
+        @ray.remote(num_gpus=1 / 4 if self.args.with_gpu else 0)
+        def remote_simulation(args, seed_offset, timeout):
+            # I think there is some nondeterminism in nle environment when playing
+            # multiple episodes (maybe bones?). That should do the trick
+            q = Queue()
+
+            def sim():
+                q.put(single_simulation(args, seed_offset, timeout=timeout))
+
+            try:
+                p = Process(target=sim, daemon=False)
+                p.start()
+                return q.get()
+            finally:
+                p.terminate()
+                p.join()
+
+            # uncomment to debug why join doesn't work properly
+            # from multiprocessing.pool import ThreadPool
+            # with ThreadPool(1) as thrpool:
+            #     def fun():
+            #         import time
+            #         while True:
+            #             time.sleep(1)
+            #             print(p.pid, p.is_alive(), p.exitcode, p)
+            #     thrpool.apply_async(fun)
+            # p.join(timeout=timeout + 1)
+            # assert not q.empty()
+
+        # bounded, so that the order of seeds is respected by the scheduler
+        max_in_flight = self.args.max_in_flight or 2 * int(ray.cluster_resources()['CPU'])
+        pending = list(seed_offsets)
+        refs = []
+        while pending or refs:
+            while pending and len(refs) < max_in_flight:
+                refs.append(remote_simulation.remote(self.args, pending.pop(0), self.timeout))
+            ref, refs = ray.wait(refs, num_returns=1, timeout=None)
+            yield ray.get(ref[0])
+
+    def _warm_worker_results(self, seed_offsets):
+        ray = self.ray
+        from ray.exceptions import RayActorError
+
+        worker_cls = ray.remote(num_gpus=1 / 4 if self.args.with_gpu else 0)(EpisodeWorker)
+        num_workers = self.args.workers or int(ray.cluster_resources()['CPU'])
+        workers = [worker_cls.remote(self.args) for _ in range(min(num_workers, len(seed_offsets)))]
+        pending = list(seed_offsets)
+        in_flight = {}  # ref -> (worker, seed_offset)
+
+        while pending or in_flight:
+            while pending and workers:
+                worker = workers.pop()
+                seed_offset = pending.pop(0)
+                in_flight[worker.run.remote(seed_offset, self.timeout)] = (worker, seed_offset)
+
+            [ref], _ = ray.wait(list(in_flight), num_returns=1, timeout=None)
+            worker, seed_offset = in_flight.pop(ref)
+            try:
+                single_res, recycle = ray.get(ref)
+            except RayActorError:
+                # e.g. killed by OOM
+                self._retry(seed_offset, pending)
+                single_res, recycle = None, True
+
+            if recycle:
+                ray.kill(worker)
+                worker = worker_cls.remote(self.args) if pending else None
+            if worker is not None:
+                workers.append(worker)
+
+            if single_res is not None:
+                yield single_res
+
+        for worker in workers:
+            ray.kill(worker)
+
+    def close(self):
+        self.ray.shutdown()
+
+
+def local_worker_main(args, conn):
+    worker = EpisodeWorker(args)
+    while 1:
+        task = conn.recv()
+        if task is None:
+            return
+        seed_offset, timeout = task
+        summary, recycle = worker.run(seed_offset, timeout)
+        conn.send((summary, recycle))
+        if recycle:
+            return
+
+
+class LocalExecutor(Executor):
+    """
+    Runs simulations in local `EpisodeWorker` processes, without a Ray cluster.
+
+    Workers are started with the 'forkserver' (or 'spawn') method and reused for many episodes. Each of them has
+    its own pipe, so a killed worker can't leave a shared queue locked. An episode that exceeds its timeout by more
+    than `KILL_GRACE` seconds (i.e. the episode thread didn't give up) gets its worker killed, as does a worker that
+    died -- the seed is then retried once in a new worker.
+    """
+
+    KILL_GRACE = 60
+
+    def __init__(self, args):
+        super().__init__(args)
+        self.ctx = multiprocessing.get_context(args.start_method)
+        self.num_workers = args.workers or os.cpu_count()
+        self.idle = []
+        self.busy = {}  # conn -> (process, seed_offset, start_time)
+
+    def _start_worker(self):
+        conn, child_conn = self.ctx.Pipe()
+        process = self.ctx.Process(target=local_worker_main, args=(self.args, child_conn), daemon=True)
+        process.start()
+        child_conn.close()
+        return process, conn
+
+    def _receive(self, conn):
+        """ Returns the summary sent by a busy worker, or None if it died without sending it """
+        try:
+            single_res, recycle = conn.recv()
+        except EOFError:
+            return None
+        process, _, _ = self.busy.pop(conn)
+        if recycle:
+            process.join()
+            conn.close()
+        else:
+            self.idle.append((process, conn))
+        return single_res
+
+    def _check_busy_workers(self, pending):
+        """ Returns summaries that arrived in the meantime. Dead and stuck workers are removed (and killed) """
+        results = []
+        for conn, (process, seed_offset, start_time) in list(self.busy.items()):
+            if process.is_alive() and time.time() - start_time < self.timeout + self.KILL_GRACE:
+                continue
+            # the worker may have finished just now (e.g. sent the summary and exited to be recycled)
+            if conn.poll():
+                single_res = self._receive(conn)
+                if single_res is not None:
+                    results.append(single_res)
+                    continue
+            if process.is_alive():
+                print(f'Killing worker {process.pid} (seed offset {seed_offset})')
+                process.kill()
+            process.join()
+            conn.close()
+            self.busy.pop(conn)
+            self._retry(seed_offset, pending)
+        return results
+
+    def results(self, seed_offsets):
+        pending = list(seed_offsets)
+        while pending or self.busy:
+            while pending and len(self.busy) < self.num_workers:
+                process, conn = self.idle.pop() if self.idle else self._start_worker()
+                seed_offset = pending.pop(0)
+                conn.send((seed_offset, self.timeout))
+                self.busy[conn] = (process, seed_offset, time.time())
+
+            for conn in multiprocessing.connection.wait(list(self.busy), timeout=1):
+                single_res = self._receive(conn)
+                # None if died, handled by `_check_busy_workers`
+                if single_res is not None:
+                    yield single_res
+            yield from self._check_busy_workers(pending)
+
+    def close(self):
+        for process, conn in self.idle:
+            conn.send(None)
+        for process, conn in self.idle:
+            process.join()
+        for process, _, _ in self.busy.values():
+            process.kill()
+            process.join()
+
+
+def order_by_predicted_duration(args, seed_offsets, *histories):
+    """
+    Sorts seed offsets so that the longest episodes start first and don't run alone at the tail of the sweep.
+    The duration of a seed is predicted from its previous results in `histories` (lists of records from
+    `ResultsStore.records`, the latest one wins), seeds without any history are assumed to take the median duration.
+    """
+    durations = {}
+    turn_durations = []
+    for records in histories:
+        for result in records:
+            if 'duration' in result:
+                durations[result['seed'][0]] = result['duration']
+                if result.get('turns'):
+                    turn_durations.append(result['duration'] / result['turns'])
+            elif result.get('turns') and turn_durations:
+                durations[result['seed'][0]] = result['turns'] * np.median(turn_durations)
+
+    if not durations:
+        return seed_offsets
+
+    median = np.median(list(durations.values()))
+    print(f'Ordering seeds by predicted duration ({len(durations)} known, median {median:.0f}s)')
+    return sorted(seed_offsets, key=lambda seed_offset: -durations.get(args.seed + seed_offset, median))
+
+
 def run_simulations(args):
-    import ray
-    ray.init(address='auto')
+    executor = RayExecutor(args) if args.executor == 'ray' else LocalExecutor(args)
 
     start_time = time.time()
     plot_queue = Queue()
@@ -218,18 +577,29 @@ def run_simulations(args):
 
         fig = plt.figure()
         plt.show(block=False)
+        # the dashboard is drawn from a uniform sample of the episodes, so that a redraw costs the same
+        # after 100 and after 100k episodes
+        rows = Reservoir(PLOT_SAMPLE_SIZE)
+        keys = []
         while 1:
-            res = None
+            # new results come as dicts of lists, they are redrawn at most every 0.5 s
+            updated = False
             try:
                 while 1:
-                    res = plot_queue.get(block=False)
+                    batch = plot_queue.get(block=False)
+                    keys = keys or list(batch.keys())
+                    for values in zip(*batch.values()):
+                        rows.add(dict(zip(batch.keys(), values)))
+                    updated = True
             except:
                 plt.pause(0.5)
-                if res is None:
+                if not updated:
                     continue
 
             fig.clear()
-            plot_dashboard(fig, res)
+            plot_dashboard(fig, {k: [row.get(k) for row in rows.values] for k in keys})
+            if rows.count > len(rows.values):
+                fig.suptitle(f'sample of {len(rows.values)} out of {rows.count} episodes')
             fig.tight_layout()
             plt.show(block=False)
 
@@ -237,63 +607,25 @@ def run_simulations(args):
         plt_process = Process(target=plot_thread_func)
         plt_process.start()
 
-    refs = []
-
-    @ray.remote(num_gpus=1 / 4 if args.with_gpu else 0)
-    def remote_simulation(args, seed_offset, timeout=500):
-        # I think there is some nondeterminism in nle environment when playing
-        # multiple episodes (maybe bones?). That should do the trick
-        q = Queue()
-
-        if args.output_video_dir is not None:
-            timeout = 4 * 24 * 60 * 60
-
-        def sim():
-            q.put(single_simulation(args, seed_offset, timeout=timeout))
-
-        try:
-            p = Process(target=sim, daemon=False)
-            p.start()
-            return q.get()
-        finally:
-            p.terminate()
-            p.join()
-
-        # uncomment to debug why join doesn't work properly
-        # from multiprocessing.pool import ThreadPool
-        # with ThreadPool(1) as thrpool:
-        #     def fun():
-        #         import time
-        #         while True:
-        #             time.sleep(1)
-        #             print(p.pid, p.is_alive(), p.exitcode, p)
-        #     thrpool.apply_async(fun)
-        # p.join(timeout=timeout + 1)
-        # assert not q.empty()
-
-    try:
-        with args.simulation_results.open('r') as f:
-            all_res = json.load(f)
-        print('Continue running: ', (len(all_res['seed'])))
-    except FileNotFoundError:
-        all_res = {}
-
-    done_seeds = set()
-    if 'seed' in all_res:
-        done_seeds = set(s[0] for s in all_res['seed'])
-
-    # remove runs finished with exceptions if rerunning with --panic-on-errors
-    if args.panic_on_errors and all_res:
-        idx_to_repeat = set()
-        for i, (seed, reason) in enumerate(zip(all_res['seed'], all_res['end_reason'])):
-            if reason.startswith('exception'):
-                idx_to_repeat.add(i)
-                done_seeds.remove(seed[0])
-        print('Repeating idx:', idx_to_repeat)
-        for k, v in all_res.items():
-            all_res[k] = [v for i, v in enumerate(v) if i not in idx_to_repeat]
+    store = writable_store(args.simulation_results)
+    if store.path != args.simulation_results:
+        print(f'Legacy results file {args.simulation_results} is read-only, continuing in {store.path}')
+    # runs finished with exceptions are repeated if rerunning with --panic-on-errors
+    # (the new results supersede the old ones in the store)
+    done_seeds = store.done_seeds(with_exceptions=not args.panic_on_errors)
+    # the seeds come from the index, the results file is parsed once for the report and the scheduling
+    records = store.records()
+    all_res = store.load(records)
+    if all_res:
+        print('Continue running: ', len(all_res['seed']))
+        if args.panic_on_errors:
+            idx_to_repeat = {i for i, seed in enumerate(all_res['seed']) if seed[0] not in done_seeds}
+            print('Repeating idx:', idx_to_repeat)
+            for k, v in all_res.items():
+                all_res[k] = [v for i, v in enumerate(v) if i not in idx_to_repeat]
 
     print('skipping seeds', done_seeds)
+    seed_offsets = []
     for seed_offset in range(args.episodes):
         seed = args.seed + seed_offset
         if seed in done_seeds:
@@ -301,67 +633,64 @@ def run_simulations(args):
         if args.seeds and seed not in args.seeds:
             continue
         if args.visualize_ends is None or seed_offset in [k % 10 ** 9 for k in args.visualize_ends]:
-            refs.append(remote_simulation.remote(args, seed_offset))
+            seed_offsets.append(seed_offset)
+    seed_offsets = order_by_predicted_duration(args, seed_offsets, records,
+                                               *[ResultsStore(path).records() for path in args.schedule_from])
+
+    # the report and the plot are updated incrementally -- the plot process keeps its own copy of the results
+    stats = SimulationStats()
+    for values in zip(*all_res.values()):
+        stats.add(dict(zip(all_res.keys(), values)))
+    if all_res:
+        plot_queue.put(all_res)
+    keys = list(all_res.keys())
 
     count = len(done_seeds)
     initial_count = count
-    for handle in refs:
-        ref, refs = ray.wait(refs, num_returns=1, timeout=None)
-        single_res = ray.get(ref[0])
-
-        if not all_res:
-            all_res = {key: [] for key in single_res}
-        assert all_res.keys() == single_res.keys()
+    for single_res in executor.results(seed_offsets):
+        single_res = {k: v if not hasattr(v, 'item') else v.item() for k, v in single_res.items()}
+        if not keys:
+            keys = list(single_res.keys())
 
         count += 1
-        for k, v in single_res.items():
-            all_res[k].append(v if not hasattr(v, 'item') else v.item())
-
-        plot_queue.put(all_res)
+        stats.add(single_res)
+        # the plotted columns have to stay aligned, so they are fixed by the first results
+        plot_queue.put({k: [single_res.get(k)] for k in keys})
 
         total_duration = time.time() - start_time
-
-        median_score_std = np.std([np.median(np.random.choice(all_res["score"],
-                                                              size=max(1, len(all_res["score"]) // 2)))
-                                   for _ in range(1024)])
+        score_quantiles = {p: q.value for p, q in stats.score_quantiles.items()}
 
         text = []
         text.append(f'count                         : {count}')
-        text.append(f'time_per_simulation           : {np.mean(all_res["duration"])}')
-        text.append(f'simulations_per_hour          : {3600 / np.mean(all_res["duration"])}')
+        text.append(f'time_per_simulation           : {stats.duration.mean}')
+        text.append(f'simulations_per_hour          : {3600 / stats.duration.mean}')
         text.append(f'simulations_per_hour(multi)   : {3600 * (count - initial_count) / total_duration}')
-        text.append(f'time_per_turn                 : {np.sum(all_res["duration"]) / np.sum(all_res["turns"])}')
-        text.append(f'turns_per_second              : {np.sum(all_res["turns"]) / np.sum(all_res["duration"])}')
-        text.append(f'turns_per_second(multi)       : {np.sum(all_res["turns"]) / total_duration}')
-        text.append(f'panic_num_per_game(median)    : {np.median(all_res["panic_num"])}')
-        text.append(f'panic_num_per_game(mean)      : {np.sum(all_res["panic_num"]) / count}')
-        text.append(f'score_median                  : {np.median(all_res["score"]):.1f} +/- '
-                    f'{median_score_std:.1f}')
-        text.append(f'score_mean                    : {np.mean(all_res["score"]):.1f} +/- '
-                    f'{np.std(all_res["score"]) / (len(all_res["score"]) ** 0.5):.1f}')
-        text.append(f'score_05-95                   : {np.quantile(all_res["score"], 0.05)} '
-                    f'{np.quantile(all_res["score"], 0.95)}')
-        text.append(f'score_25-75                   : {np.quantile(all_res["score"], 0.25)} '
-                    f'{np.quantile(all_res["score"], 0.75)}')
-        text.append(f'exceptions                    : '
-                    f'{sum([r.startswith("exception:") for r in all_res["end_reason"]])}')
-        text.append(f'steplimit                     : '
-                    f'{sum([r.startswith("steplimit") or r.startswith("ABORT") for r in all_res["end_reason"]])}')
-        text.append(f'timeout                       : '
-                    f'{sum([r.startswith("timeout") for r in all_res["end_reason"]])}')
+        text.append(f'time_per_turn                 : {stats.duration.sum / stats.turns.sum}')
+        text.append(f'turns_per_second              : {stats.turns.sum / stats.duration.sum}')
+        text.append(f'turns_per_second(multi)       : {stats.turns.sum / total_duration}')
+        text.append(f'panic_num_per_game(median)    : {stats.panic_num_median.value}')
+        text.append(f'panic_num_per_game(mean)      : {stats.panic_num.sum / count}')
+        text.append(f'score_median                  : {score_quantiles[0.5]:.1f} +/- '
+                    f'{stats.score_reservoir.bootstrap_median_std():.1f}')
+        text.append(f'score_mean                    : {stats.score.mean:.1f} +/- '
+                    f'{stats.score.std / (stats.score.count ** 0.5):.1f}')
+        text.append(f'score_05-95                   : {score_quantiles[0.05]} {score_quantiles[0.95]}')
+        text.append(f'score_25-75                   : {score_quantiles[0.25]} {score_quantiles[0.75]}')
+        text.append(f'exceptions                    : {stats.end_reasons["exceptions"]}')
+        text.append(f'steplimit                     : {stats.end_reasons["steplimit"]}')
+        text.append(f'timeout                       : {stats.end_reasons["timeout"]}')
         print('\n'.join(text) + '\n')
 
         if args.visualize_ends is None:
-            with args.simulation_results.open('w') as f:
-                json.dump(all_res, f)
+            store.append(single_res)
 
     print('DONE!')
-    ray.shutdown()
+    executor.close()
 
 
 def parse_args():
     parser = ArgumentParser()
-    parser.add_argument('mode', choices=('simulate', 'run', 'profile'))
+    parser.add_argument('mode', choices=('simulate', 'run', 'profile', 'replay'))
     parser.add_argument('--seed', type=int, help='Starting random seed')
     parser.add_argument('--seeds', nargs="*", type=int,
                         help='Run only these specific seeds (only relevant in simulate mode)')
@@ -381,8 +710,48 @@ def parse_args():
                         help="Episode visualization video directory -- valid only with 'simulate' mode")
     parser.add_argument('--profiler', choices=('cProfile', 'pyinstrument', 'none'), default='pyinstrument')
     parser.add_argument('--with-gpu', action='store_true')
-    parser.add_argument('--simulation-results', default='nh_sim.json', type=Path,
-                        help='path to simulation results json. Only for simulation mode')
+    parser.add_argument('--profile-strategies', action='store_true',
+                        help='Record per strategy condition counts and timings in simulation results')
+    parser.add_argument('--executor', choices=('ray', 'local'), default='ray',
+                        help="Where to run simulations: on a running Ray cluster or in local worker processes")
+    parser.add_argument('--start-method', choices=('forkserver', 'spawn'), default='forkserver',
+                        help="Start method of local worker processes (only for '--executor local')")
+    parser.add_argument('--warm-workers', action='store_true',
+                        help='Run episodes in long-lived workers instead of a new process per episode '
+                             "(always the case for '--executor local')")
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Number of workers (all CPUs by default)')
+    parser.add_argument('--worker-max-episodes', type=int, default=50,
+                        help='Recycle a warm worker after that many episodes')
+    parser.add_argument('--worker-max-rss-growth', type=int, default=2048,
+                        help='Recycle a warm worker when its RSS grew by that many MiB since the first episode')
+    parser.add_argument('--max-in-flight', type=int, default=None,
+                        help='Maximum number of submitted episodes on a Ray cluster (2 x CPUs by default)')
+    parser.add_argument('--schedule-from', type=Path, nargs='*', default=[],
+                        help='Results of previous runs used to start the longest seeds first '
+                             '(the results of the current run are always used)')
+    parser.add_argument('--max-episode-time', type=float, default=4 * 60 * 60,
+                        help='Hard limit of a simulated episode wall time in seconds')
+    parser.add_argument('--watchdog-window', type=float, default=300,
+                        help='Stop a simulated episode as a timeout if it advanced less than '
+                             '--watchdog-min-turns-per-second on average in that many seconds. '
+                             'Watching starts at the first turn of the game. The window should be longer '
+                             'than computations without game turns, e.g. solving Sokoban')
+    parser.add_argument('--watchdog-min-turns-per-second', type=float, default=0.1,
+                        help='See --watchdog-window')
+    parser.add_argument('--simulation-results', default='nh_sim.jsonl', type=Path,
+                        help='path to simulation results (append-only jsonl, see autoascend/results_store.py). '
+                             'A legacy .json file is continued in a .jsonl file next to it. '
+                             'Only for simulation mode')
+    parser.add_argument('--trace', type=Path, default=None,
+                        help="Trace directory (from --trace-dir) to replay -- only for 'replay' mode")
+    parser.add_argument('--replay-steps', type=int, default=None,
+                        help='Number of recorded actions to replay (all by default)')
+    parser.add_argument('--play-after-replay', action='store_true',
+                        help='Hand control to a fresh agent (interactively) after replaying')
+    parser.add_argument('--trace-dir', type=Path, default=None,
+                        help='Record a binary step trace of every episode to <trace-dir>/<seed> '
+                             '(see autoascend/trace.py)')
 
     args = parser.parse_args()
     if args.seed is None:
@@ -395,6 +764,9 @@ def parse_args():
     if args.output_video_dir is not None:
         assert args.mode == 'simulate', "Video output only valid in 'simulate' mode"
 
+    if args.mode == 'replay':
+        assert args.trace is not None, "'replay' mode requires --trace"
+
     print('ARGS:', args)
     return args
 
@@ -407,6 +779,8 @@ def main():
         run_profiling(args)
     elif args.mode == 'run':
         run_single_interactive_game(args)
+    elif args.mode == 'replay':
+        run_replay(args)
     else:
         assert 0
 
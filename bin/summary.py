@@ -1,11 +1,11 @@
-import json
 import sys
 from collections import Counter
-from pathlib import Path
 
 import numpy as np
 import pandas as pd
 
+from autoascend.results_store import load_results
+
 HEADER = '-' * 50
 
 
@@ -18,9 +18,7 @@ def extract_last_place_from_exception(text):
 
 
 def load_df(filepath):
-    with Path(filepath).open() as f:
-        df = json.load(f)
-    df = pd.DataFrame.from_dict(df)
+    df = pd.DataFrame.from_dict(load_results(filepath))
     for k in df.keys():
         df[k] = [tuple(v) if isinstance(v, list) else v for v in df[k]]
     return df
@@ -156,5 +154,5 @@ if __name__ == '__main__':
     pd.set_option('display.width', None)
     pd.set_option('display.max_colwidth', 30)
 
-    filepath = '/workspace/nh_sim.json' if len(sys.argv) <= 1 else sys.argv[1]
+    filepath = '/workspace/nh_sim.jsonl' if len(sys.argv) <= 1 else sys.argv[1]
     main(filepath)